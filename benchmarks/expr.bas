@@ -0,0 +1,6 @@
+"2X+1"->Str1
+0->S
+For(X,1,1500)
+S+expr(Str1)->S
+End
+Disp S
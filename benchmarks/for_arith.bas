@@ -0,0 +1,6 @@
+0->S
+For(I,1,5000)
+S+I*3-I/2->S
+S-2I+I^2/I->S
+End
+Disp S
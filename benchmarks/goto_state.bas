@@ -0,0 +1,17 @@
+0->S:0->N
+Lbl A
+N+1->N
+If N>2000
+Goto E
+S+1->S
+Goto B
+Lbl B
+S+2->S
+If S>100
+Goto C
+Goto A
+Lbl C
+0->S
+Goto A
+Lbl E
+Disp N,S
@@ -0,0 +1,13 @@
+{0}->lA
+For(I,1,600)
+I->lA(I)
+End
+0->S
+For(I,1,600)
+S+lA(I)->S
+End
+For(J,1,100)
+lA*2->lB
+lA+lB->lC
+End
+Disp S,dim(lC)
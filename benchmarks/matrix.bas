@@ -0,0 +1,12 @@
+[[1,2,3][4,5,6][7,8,10]]->[A]
+For(I,1,1000)
+[A]*[A]->[B]
+[B]-[A]->[C]
+det([C])->D
+End
+For(I,1,3)
+For(J,1,3)
+[A](I,J)+1->[A](I,J)
+End
+End
+Disp [C],D
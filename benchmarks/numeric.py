@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+# measures the cost of a single multiplication or division in each numeric mode
+import os
+import sys
+import timeit
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(here))
+
+from pitybas import tokens
+from pitybas.interpret import Interpreter
+from pitybas.numeric import MODES
+
+OPERANDS = (
+    ('int * int', tokens.Mult, 12, 34),
+    ('int / int', tokens.Div, 22, 7),
+    ('float * int', tokens.Mult, 0.1, 3),
+    ('float / float', tokens.Div, 1.5, 0.25),
+)
+
+def main(number=100000):
+    modes = sorted(MODES)
+    print '%-14s' % 'op' + ''.join('%14s' % mode for mode in modes)
+    for name, cls, left, right in OPERANDS:
+        row = '%-14s' % name
+        for mode in modes:
+            vm = Interpreter([], numeric=mode)
+            apply = cls().apply
+            cost = min(timeit.repeat(lambda: apply(vm, left, right), number=number, repeat=3))
+            row += '%11.3fus' % (cost / number * 1e6)
+        print row
+
+if __name__ == '__main__':
+    main()
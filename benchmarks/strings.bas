@@ -0,0 +1,10 @@
+""->Str1
+For(I,1,1500)
+Str1+"AB"->Str1
+End
+0->N
+For(I,1,1500)
+If sub(Str1,2I-1,1)="A"
+N+1->N
+End
+Disp length(Str1),N
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# generates TI-BASIC programs of a tunable size, and tabulates how parsing and running them scales with each knob
+import math
+import os
+import shutil
+import sys
+import tempfile
+from optparse import OptionParser
+from timeit import default_timer as timer
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(here))
+
+from pitybas.bench import Quiet
+from pitybas.interpret import Interpreter
+from pitybas.parse import Parser
+from pitybas.program import Program
+
+DEFAULTS = {
+    'lines': 200,     # statements in the innermost block
+    'depth': 2,       # nested For and If/Then blocks around them
+    'distance': 50,   # rows skipped by a Goto to its Lbl
+    'expr': 4,        # terms in each expression
+    'elements': 20,   # elements in a list which is summed
+    'fanout': 2,      # programs called with pgrm
+}
+
+SWEEPS = {
+    'lines': [250, 500, 1000, 2000, 4000],
+    'depth': [2, 4, 8, 16],
+    'distance': [250, 500, 1000, 2000, 4000],
+    'expr': [4, 8, 16, 32, 64],
+    'elements': [50, 100, 200, 400, 800],
+    'fanout': [2, 4, 8, 16, 32],
+}
+
+# loop variables, leaving S for the sum
+LETTERS = 'ABCDEFGHIJKLMNOPQRTUVWXYZ'
+
+def sub_name(i):
+    # pgrm names are letters only
+    name = ''
+    i += 1
+    while i:
+        i, rem = divmod(i - 1, 26)
+        name = chr(ord('A') + rem) + name
+    return 'SYN' + name
+
+def expression(terms, var):
+    ops = '+-*'
+    parts = [var]
+    for i in xrange(1, terms):
+        parts.append(ops[i % 3] + str(i % 9 + 1))
+    return ''.join(parts)
+
+def nest(depth, body):
+    # alternating For and If/Then blocks around the body, each For looping once
+    out = []
+    for level in xrange(depth):
+        if level % 2 == 0:
+            out.append('For(%s,1,1)' % LETTERS[level])
+        else:
+            out.append('If S>=0:Then')
+
+    return out + body + ['End'] * depth
+
+def skipped(times, body):
+    # a loop which skips the body behind a false If each time around
+    return ['For(I,1,%i)' % times, 'If I<0:Then'] + body + ['End', 'End']
+
+def generate(lines=200, depth=2, distance=50, expr=4, elements=20, fanout=2):
+    '''
+    returns the source of the main program, and a dict of the programs it calls by name
+    the blocks skipped and the rows jumped over grow with their knob, and so does the number of times
+    the program skips or jumps: the time grows linearly while each skip and Goto takes one step,
+    and quadratically if they scan the rows in between
+    '''
+    if depth > len(LETTERS):
+        raise ValueError('depth can be at most %i' % len(LETTERS))
+
+    out = ['0->S']
+    out.append('{%s}->lSYN' % ','.join(str(i % 10) for i in xrange(elements)))
+
+    var = LETTERS[0] if depth else 'S'
+    body = ['S+(%s)->S' % expression(expr, var) for i in xrange(lines)]
+    out.extend(nest(depth, body))
+
+    # the same statements skipped once per statement, and a nest holding 100 rows per level skipped 100 times per level
+    out.extend(skipped(lines, body))
+    out.extend(skipped(100 * depth, nest(depth, ['S+1->S'] * 100 * depth)))
+
+    # the list is summed one element at a time
+    out.append('For(I,1,dim(lSYN))')
+    out.append('S+lSYN(I)->S')
+    out.append('End')
+
+    # a Goto over the distance to its Lbl, and one back, as many times as the distance
+    out.append('0->I')
+    out.append('Lbl SX')
+    out.append('I+1->I')
+    out.append('Goto SY')
+    for i in xrange(distance):
+        out.append('S-1->S')
+    out.append('Lbl SY')
+    out.append('If I<%i' % distance)
+    out.append('Goto SX')
+
+    subs = {}
+    for i in xrange(fanout):
+        name = sub_name(i)
+        out.append('pgrm' + name)
+        subs[name] = 'S+%i->S\n' % (i + 1)
+
+    out.append('Disp S')
+    return '\n'.join(out) + '\n', subs
+
+def measure(source, subs, directory, repeat=3):
+    # returns the best parse and run times of a few tries
+    for name, sub in subs.items():
+        with open(os.path.join(directory, name + '.bas'), 'w') as f:
+            f.write(sub)
+
+    parse = run = None
+    for i in xrange(repeat):
+        start = timer()
+        code = Parser(source).parse()
+        elapsed = timer() - start
+        parse = min(parse, elapsed) if parse is not None else elapsed
+
+        vm = Interpreter(Program(code), io=Quiet, path=[directory], cache=False)
+        start = timer()
+        vm.execute()
+        elapsed = timer() - start
+        run = min(run, elapsed) if run is not None else elapsed
+
+    for name in subs:
+        os.remove(os.path.join(directory, name + '.bas'))
+
+    return parse, run
+
+def growth(before, after, ratio):
+    # how many times longer a step took per doubling of the knob: 2 is linear, and 4 quadratic
+    if not before or ratio <= 1:
+        return ''
+
+    return '%.2f' % ((after / before) ** (1 / math.log(ratio, 2)))
+
+def sweep(knob, values, directory, out=sys.stdout):
+    print >>out, '%-10s %10s %8s %10s %8s' % (knob, 'parse', 'growth', 'run', 'growth')
+    last = None
+    for value in values:
+        kwargs = dict(DEFAULTS)
+        kwargs[knob] = value
+        parse, run = measure(*generate(**kwargs), directory=directory)
+
+        grew = ('', '')
+        if last:
+            ratio = float(value) / last[0]
+            grew = (growth(last[1], parse, ratio), growth(last[2], run, ratio))
+
+        print >>out, '%-10i %9.4fs %8s %9.4fs %8s' % (value, parse, grew[0], run, grew[1])
+        last = value, parse, run
+
+    print >>out
+
+def main():
+    parser = OptionParser(usage='Usage: synthetic.py [options] [knob ...]')
+    parser.add_option('--print', dest="print_", action="store_true", help="print one program instead, using the knobs given as name=value")
+    options, args = parser.parse_args()
+
+    if options.print_:
+        kwargs = dict(DEFAULTS)
+        for arg in args:
+            name, value = arg.split('=', 1)
+            if not name in DEFAULTS:
+                parser.error('unknown knob: %s' % name)
+            kwargs[name] = int(value)
+
+        source, subs = generate(**kwargs)
+        sys.stdout.write(source)
+        for name, sub in sorted(subs.items()):
+            sys.stdout.write('\n# %s.bas\n%s' % (name, sub))
+        return
+
+    knobs = args or sorted(SWEEPS)
+    for knob in knobs:
+        if not knob in SWEEPS:
+            parser.error('unknown knob: %s (choose from %s)' % (knob, ', '.join(sorted(SWEEPS))))
+
+    directory = tempfile.mkdtemp()
+    try:
+        for knob in knobs:
+            sweep(knob, SWEEPS[knob], directory)
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main()
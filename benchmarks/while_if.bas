@@ -0,0 +1,12 @@
+0->A:0->B:0->N
+While N<3000
+N+1->N
+If N>1500:Then
+A+1->A
+Else
+B+1->B
+End
+If A>B
+A-1->A
+End
+Disp A,B
@@ -0,0 +1,203 @@
+'''
+runs the programs in benchmarks/, and reports statements run per second, wall time and peak memory as JSON
+each workload runs in its own forked process, so they can't warm up or bloat each other
+
+results from two runs can be compared, which flags workloads whose ops/sec dropped by more than a threshold,
+and by more than the noise measured in both runs
+'''
+import json
+import os
+import platform
+import resource
+import sys
+from timeit import default_timer as timer
+
+import pitybas
+from interpret import Interpreter
+from parse import Parser
+from program import Program
+from pitybas.io.simple import IO
+
+DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks')
+
+# the large source for the parse workload is every benchmark repeated this many times
+PARSE_COPIES = 50
+
+# each workload runs for at least this many seconds, split over ROUNDS rounds of every workload,
+# so a stretch where the machine is busy slows some of each workload's runs instead of all of one's
+SAMPLE_TIME = 4.0
+ROUNDS = 4
+
+class Quiet(IO):
+    '''discards output, so the benchmarks measure the interpreter instead of the terminal'''
+    def clear(self): pass
+    def disp(self, msg=''): pass
+    def output(self, x, y, msg): pass
+    def pause(self, msg=''): pass
+
+def workloads(names=None):
+    found = sorted(name[:-4] for name in os.listdir(DIRECTORY) if name.endswith('.bas'))
+    found.append('parse')
+    if names:
+        missing = set(names) - set(found)
+        if missing:
+            raise ValueError('unknown benchmarks: %s' % ', '.join(sorted(missing)))
+
+        found = [name for name in found if name in names]
+
+    return found
+
+def source(name):
+    with open(os.path.join(DIRECTORY, name + '.bas')) as f:
+        return f.read().decode('utf8')
+
+def sample(setup, repeat):
+    # runs what setup returns at least repeat times and for at least SAMPLE_TIME / ROUNDS seconds
+    times = []
+    stop = timer() + SAMPLE_TIME / ROUNDS
+    while len(times) < repeat or timer() < stop:
+        func = setup()
+        start = timer()
+        func()
+        times.append(timer() - start)
+
+    return times
+
+def measure_parse(repeat):
+    sources = [source(name) for name in workloads() if name != 'parse']
+    big = '\n'.join(sources * PARSE_COPIES)
+    ops = len(big.split('\n'))
+
+    times = sample(lambda: Parser(big).parse, repeat)
+    return {'ops': ops, 'parse': min(times), 'times': times}
+
+def measure_program(name, repeat, kwargs):
+    start = timer()
+    program = Program.from_string(source(name))
+    parse = timer() - start
+
+    # statements are counted in an untimed first run, which also warms up the line cache
+    vm = Interpreter(program, io=Quiet, **kwargs)
+    run = vm.run
+    counter = [0]
+    def counted(cur):
+        counter[0] += 1
+        run(cur)
+    vm.run = counted
+    vm.execute()
+
+    times = sample(lambda: Interpreter(program, io=Quiet, **kwargs).execute, repeat)
+    return {'ops': counter[0], 'parse': parse, 'times': times}
+
+def measure(name, repeat, kwargs):
+    if name == 'parse':
+        result = measure_parse(repeat)
+    else:
+        result = measure_program(name, repeat, kwargs)
+
+    # ru_maxrss is in kilobytes on linux, and bytes on os x
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak /= 1024
+    result['peak_kb'] = peak
+    return result
+
+def forked(name, repeat, kwargs):
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        # the child reports through the pipe, and anything the program prints is thrown away
+        os.close(read)
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, 1)
+        try:
+            result = measure(name, repeat, kwargs)
+        except Exception, e:
+            result = {'error': '%s: %s' % (e.__class__.__name__, e)}
+
+        with os.fdopen(write, 'w') as f:
+            json.dump(result, f)
+        os._exit(0)
+
+    os.close(write)
+    with os.fdopen(read) as f:
+        data = f.read()
+    os.waitpid(pid, 0)
+
+    if not data:
+        return {'error': 'benchmark process died'}
+
+    return json.loads(data)
+
+def summarize(rounds):
+    # keeps the fastest run of all rounds, and how much slower the median run was in percent as the noise
+    for result in rounds:
+        if 'error' in result:
+            return result
+
+    times = sorted(t for result in rounds for t in result['times'])
+    best = times[0]
+    return {
+        'ops': rounds[0]['ops'],
+        'parse': min(result['parse'] for result in rounds),
+        'wall': best,
+        'ops_per_sec': rounds[0]['ops'] / best if best else 0,
+        'noise': (times[len(times) // 2] / best - 1) * 100 if best else 0.0,
+        'runs': len(times),
+        'peak_kb': max(result['peak_kb'] for result in rounds),
+    }
+
+def run(names=None, repeat=5, **kwargs):
+    names = workloads(names)
+    rounds = dict((name, []) for name in names)
+    for i in xrange(ROUNDS):
+        for name in names:
+            rounds[name].append(forked(name, max(1, repeat // ROUNDS), kwargs))
+
+    results = {}
+    for name in names:
+        result = results[name] = summarize(rounds[name])
+        if 'error' in result:
+            print >>sys.stderr, '%-12s %s' % (name, result['error'])
+        else:
+            print >>sys.stderr, '%-12s %10.0f ops/s %8.3fs %6.1f%% noise %8i KB' % (name, result['ops_per_sec'], result['wall'],
+                                                                               result['noise'], result['peak_kb'])
+
+    return {
+        'pitybas': pitybas.__version__,
+        'python': platform.python_version(),
+        'settings': kwargs,
+        'results': results,
+    }
+
+def compare(old, new, threshold=10.0, out=sys.stderr):
+    # returns the names of the workloads which got slower by more than threshold percent,
+    # and by more than the noise of both runs, as a change within the noise can't be told apart from it
+    regressions = []
+    print >>out, '%-12s %12s %12s %8s %8s' % ('benchmark', 'old ops/s', 'new ops/s', 'change', 'noise')
+    for name in sorted(set(old['results']) | set(new['results'])):
+        a, b = old['results'].get(name, {}), new['results'].get(name, {})
+        if not 'ops_per_sec' in a or not 'ops_per_sec' in b:
+            # missing from one of the runs, or failed
+            rates = ['%.0f' % r['ops_per_sec'] if 'ops_per_sec' in r else '-' for r in (a, b)]
+            print >>out, '%-12s %12s %12s' % (name, rates[0], rates[1])
+            continue
+
+        change = (b['ops_per_sec'] / a['ops_per_sec'] - 1) * 100 if a['ops_per_sec'] else 0
+        # each run's noise is how much slower than its best its median was, and either run's best can be off by that much,
+        # shown as the drop in ops/s that both together would make
+        noise = (1 - 1 / (1 + (a.get('noise', 0) + b.get('noise', 0)) / 100.0)) * 100
+        flag = ''
+        if change < -max(threshold, noise):
+            flag = '  REGRESSION'
+            regressions.append(name)
+        elif change < -threshold:
+            flag = '  (within noise)'
+
+        print >>out, '%-12s %12.0f %12.0f %+7.1f%% %7.1f%%%s' % (name, a['ops_per_sec'], b['ops_per_sec'], change, noise, flag)
+
+    return regressions
+
+def load(filename):
+    with open(filename) as f:
+        return json.load(f)
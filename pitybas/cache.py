@@ -0,0 +1,71 @@
+'''
+parsed programs are cached next to their source, so prog.bas is loaded from prog.pbc
+
+a .pbc file starts with a header line: PBC <format> <pitybas version> <sha1 of the source>
+followed by the pickled code and the source line of each row. a cached program is only used if all three match,
+otherwise the source is parsed again and the cache is rewritten.
+bump FORMAT whenever a change to the tokens or parser would change the parsed code.
+'''
+import cPickle
+import hashlib
+import os
+
+import pitybas
+from common import gc_paused
+from parse import Parser
+
+FORMAT = 2
+MAGIC = 'PBC'
+
+def cache_path(filename):
+    return os.path.splitext(filename)[0] + '.pbc'
+
+def header(source):
+    return '%s %i %s %s\n' % (MAGIC, FORMAT, pitybas.__version__, hashlib.sha1(source).hexdigest())
+
+def read(path, expected):
+    try:
+        with open(path, 'rb') as f:
+            if f.readline() != expected:
+                return None
+
+            with gc_paused():
+                return cPickle.load(f)
+    except Exception:
+        # missing, truncated, or written by an incompatible version
+        return None
+
+def write(path, head, code):
+    # written to a temporary file first, so another process never reads a partial cache
+    tmp = '%s.%i.tmp' % (path, os.getpid())
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(head)
+            cPickle.dump(code, f, 2)
+        os.rename(tmp, path)
+    except (IOError, OSError):
+        # the cache is optional, so an unwritable directory isn't an error
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+def parse(source):
+    parser = Parser(source.decode('utf8'))
+    code = parser.parse()
+    return code, parser.rows
+
+def load(filename, cache=True):
+    # returns the parsed code, and the source line of each row
+    source = open(filename, 'rb').read()
+    if not cache:
+        return parse(source)
+
+    path = cache_path(filename)
+    head = header(source)
+    parsed = read(path, head)
+    if parsed is None:
+        parsed = parse(source)
+        write(path, head, parsed)
+
+    return parsed
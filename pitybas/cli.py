@@ -1,32 +1,142 @@
-import sys, traceback
+import json, os, sys, traceback
+from functools import partial
 from optparse import OptionParser
 from interpret import Interpreter, Repl
 from common import Error
+from parse import LINES
+from profiler import Profiler
+from sampler import Sampler
+from transpile import transpile_file
 from pitybas.io.vt100 import IO as vt100
+from pitybas.io.headless import IO as headless
+from pitybas.io.memory import IO as memory
+from pitybas.io.script import Script
 
 parser = OptionParser(usage='Usage: pb.py [options] filename')
 parser.add_option('-a', '--ast', dest="ast", action="store_true", help="parse, print ast, and quit")
 parser.add_option('-d', '--dump', dest="vardump", action="store_true", help="dump variables in stacktrace")
 parser.add_option('-s', '--stacktrace', dest="stacktrace", action="store_true", help="always stacktrace")
 parser.add_option('-v', '--verbose', dest="verbose", action="store_true", help="verbose output")
-parser.add_option('-i', '--io', dest="io", help="select an IO system: simple (default), vt100")
+parser.add_option('-i', '--io', dest="io", help="select an IO system: simple (default), vt100, headless, memory")
+parser.add_option('--script', dest="script", help="read Input answers, Menu( choices and getKey presses from this file, implies -i headless unless -i memory is given; idle N makes N getKey calls return 0, and sleep SECONDS makes them return 0 for that long")
+parser.add_option('--json', dest="json", action="store_true", help="with -i headless or memory, write output as JSON lines")
+parser.add_option('--snapshot', dest="snapshot", default="end", type="choice", choices=("end", "step"),
+                  help="with -i memory, write the home screen when the program ends (default), or after each step which changes it")
+parser.add_option('--fps', dest="fps", type="float", help="with -i vt100, draw the screen at most this many times a second")
+parser.add_option('-e', '--eval', dest="evaluator", default="tree", type="choice", choices=("tree", "closure"),
+                  help="select an expression evaluator: tree (default), closure")
+parser.add_option('-n', '--numeric', dest="numeric", default="decimal", type="choice", choices=("decimal", "float", "ti14"),
+                  help="select a numeric mode: decimal (default, floats rounded to 15 digits after each * and /, and to 14 when displayed), float (native floats), ti14 (native floats rounded to 14 digits when displayed)")
+parser.add_option('-p', '--path', dest="path", help="directories to search for pgrm programs, separated by '%s' (default: .)" % os.pathsep)
+parser.add_option('--max-frames', dest="max_frames", type="int", default=1000, help="limit on nested pgrm calls (default: 1000)")
+parser.add_option('--no-cache', dest="cache", action="store_false", default=True, help="don't read or write the parsed program cache (.pbc)")
+parser.add_option('--profile', dest="profile", action="store_true", help="time each line and token class, and print the hottest when the program ends")
+parser.add_option('--sample', dest="sample", help="sample where the program is running, and write folded stacks for flamegraphs to this file")
+parser.add_option('--sample-interval', dest="sample_interval", type="float", default=5, help="cpu time between samples, in milliseconds (default: 5)")
+parser.add_option('--bench', dest="bench", action="store_true", help="run the benchmarks named as arguments (default: all), and write their results as JSON")
+parser.add_option('--compare', dest="compare", help="compare benchmark results to this JSON file, or to a results file given as an argument")
+parser.add_option('--threshold', dest="threshold", type="float", default=10.0, help="percent drop in ops/sec which --compare reports as a regression (default: 10)")
+parser.add_option('-c', '--compile', dest="compile", action="store_true", help="compile the program to a python module and quit")
+parser.add_option('-o', '--output', dest="output", help="file to write the compiled module to (default: stdout)")
+
+def load_error(e):
+    # errors found before the program runs, which only have a line if they're about one
+    if e.line is None:
+        print '%s:' % e.__class__.__name__, e.msg
+    else:
+        print '%s on line %i:' % (e.__class__.__name__, e.line), e.msg
+    sys.exit(1)
 
 (options, args) = parser.parse_args()
 
+if options.bench or options.compare:
+    import bench
+    if options.bench:
+        try:
+            results = bench.run(args, evaluator=options.evaluator, numeric=options.numeric)
+        except ValueError, e:
+            print >>sys.stderr, e
+            sys.exit(1)
+
+        data = json.dumps(results, indent=2, sort_keys=True) + '\n'
+        if options.output:
+            open(options.output, 'w').write(data)
+        else:
+            sys.stdout.write(data)
+    elif len(args) == 1:
+        results = bench.load(args[0])
+    else:
+        parser.print_help()
+        sys.exit(1)
+
+    if options.compare:
+        print >>sys.stderr
+        if bench.compare(bench.load(options.compare), results, options.threshold):
+            sys.exit(1)
+    sys.exit(0)
+
 if len(args) > 1:
     parser.print_help()
     sys.exit(1)
 
+if options.compile:
+    if not args:
+        parser.print_help()
+        sys.exit(1)
+
+    try:
+        source, reason = transpile_file(args[0])
+    except Error, e:
+        load_error(e)
+
+    if reason:
+        print >>sys.stderr, 'Warning: %s, so the module runs it with the interpreter' % reason
+    if options.output:
+        open(options.output, 'w').write(source)
+    else:
+        sys.stdout.write(source)
+    sys.exit(0)
+
 io = None
 if options.io == 'vt100':
-    io = vt100
+    io = partial(vt100, fps=options.fps)
+elif options.io == 'headless':
+    io = partial(headless, json=options.json)
+elif options.io == 'memory':
+    io = partial(memory, json=options.json, snapshot=options.snapshot)
+
+if options.script:
+    try:
+        script = Script.load(options.script)
+        if options.io == 'memory':
+            io = partial(memory, json=options.json, snapshot=options.snapshot, script=script)
+        else:
+            io = partial(headless, json=options.json, script=script)
+    except (IOError, Error), e:
+        print >>sys.stderr, e
+        sys.exit(1)
+
+path = None
+if options.path:
+    path = options.path.split(os.pathsep)
+
+# the history shown in stacktraces is only recorded when asked for, as it slows down every statement
+trace = bool(options.stacktrace or options.verbose)
 
 if args:
-    vm = Interpreter.from_file(args[0], history=20, io=io)
+    try:
+        vm = Interpreter.from_file(args[0], history=20, io=io, evaluator=options.evaluator, numeric=options.numeric, cache=options.cache, path=path,
+                                  max_frames=options.max_frames, trace=trace)
+    except Error, e:
+        load_error(e)
 else:
     print 'Welcome to pitybas. Press Ctrl-D to exit.'
     print
-    vm = Repl(history=20, io=io)
+    vm = Repl(history=20, io=io, evaluator=options.evaluator, numeric=options.numeric, cache=options.cache, path=path,
+              max_frames=options.max_frames, trace=trace)
+
+for msg in vm.diagnostics:
+    print >>sys.stderr, 'Warning:', msg
 
 if options.verbose:
     vm.print_tokens()
@@ -37,17 +147,27 @@ if options.ast:
     print_ast(vm)
     sys.exit(0)
 
+profiler = None
+if options.profile:
+    profiler = Profiler()
+    profiler.install(vm)
+
+sampler = None
+if options.sample:
+    sampler = Sampler(vm, open(options.sample, 'w'), interval=options.sample_interval / 1000.0)
+    sampler.start()
+
 try:
     vm.execute()
     if options.stacktrace:
-        vm.print_stacktrace(options.vardump)
+        vm.print_stacktrace(vardump=options.vardump)
 except KeyboardInterrupt:
     print
-    vm.print_stacktrace(options.vardump)
+    vm.print_stacktrace(vardump=options.vardump)
 except Exception, e:
     print
     print
-    vm.print_stacktrace(options.vardump)
+    vm.print_stacktrace(vardump=options.vardump)
 
     print '%s on line %i:' % (e.__class__.__name__, vm.line),
 
@@ -57,3 +177,15 @@ except Exception, e:
         print
         print '-===[ Python traceback ]===-'
         print traceback.format_exc()
+
+if sampler:
+    sampler.stop()
+    sampler.out.close()
+
+if profiler:
+    profiler.uninstall()
+    print >>sys.stderr
+    profiler.report(sys.stderr)
+
+if options.verbose:
+    print >>sys.stderr, 'expr( and Input cache: %i hits, %i misses' % (LINES.hits, LINES.misses)
@@ -0,0 +1,179 @@
+import re
+
+import tokens
+import vector
+from common import normalize
+from expression import Base, Tuple, MatrixExpr
+
+# operators done with python syntax when neither side is a list or matrix, with the same result as apply()
+# scalar: Operator.apply(), n(op), integer: FloatOperator.apply(), exact on two ints, bool: Bool.apply()
+NATIVE = {
+    tokens.Plus: ('scalar', '%s + %s'),
+    tokens.Minus: ('scalar', '%s - %s'),
+    tokens.Pow: ('scalar', '%s ** %s'),
+    tokens.Mult: ('integer', '%s * %s'),
+    tokens.Equals: ('bool', '%s == %s'),
+    tokens.NotEquals: ('bool', '%s != %s'),
+    tokens.LessThan: ('bool', '%s < %s'),
+    tokens.GreaterThan: ('bool', '%s > %s'),
+    tokens.LessOrEquals: ('bool', '%s <= %s'),
+    tokens.LessOrEqualsToken: ('bool', '%s <= %s'),
+    tokens.GreaterOrEquals: ('bool', '%s >= %s'),
+    tokens.GreaterOrEqualsToken: ('bool', '%s >= %s'),
+    tokens.And: ('bool', '%s and %s'),
+    tokens.Or: ('bool', '%s or %s'),
+    tokens.xor: ('bool', '%s ^ %s'),
+}
+
+NAME = re.compile(r'\w+$')
+
+class Compiler(object):
+    '''
+    generates python source for expressions, following the same step order as Base.get()
+    '''
+    def __init__(self):
+        self.consts = {}
+        self.temps = 0
+
+    def const(self, value):
+        name = 'k%i' % len(self.consts)
+        self.consts[name] = value
+        return name
+
+    def method(self, token, name):
+        return self.const(getattr(token, name))
+
+    def literal(self, operand):
+        # returns (True, value) if operand is a constant known now
+        if operand in self.consts:
+            return True, self.consts[operand]
+
+        return False, None
+
+    def check(self, operand, kind):
+        # python source testing operand at runtime, or True/False if that's already known
+        known, value = self.literal(operand)
+        if kind == 'integer':
+            if known:
+                return value.__class__ is int
+            return '%s.__class__ is int' % operand
+        else:
+            if known:
+                return not value.__class__ in vector.TYPES
+            return '%s.__class__ not in V' % operand
+
+    def operation(self, token, left, right):
+        slow = '%s(vm, %s, %s)' % (self.method(token, 'apply'), left, right)
+        native = NATIVE.get(token.__class__)
+        if native is None:
+            return 'n(%s)' % slow
+
+        kind, fmt = native
+        checks = [self.check(left, kind), self.check(right, kind)]
+        if False in checks:
+            return 'n(%s)' % slow
+
+        fast = fmt % tuple(x if NAME.match(x) else '(%s)' % x for x in (left, right))
+        cond = ' and '.join(c for c in checks if c is not True)
+        if kind == 'scalar':
+            if cond:
+                return 'n(%s if %s else %s)' % (fast, cond, slow)
+            return 'n(%s)' % fast
+        elif kind == 'integer':
+            if cond:
+                return '%s if %s else n(%s)' % (fast, cond, slow)
+            return fast
+        else:
+            fast = '(1 if %s else 0)' % fast
+            if cond:
+                return '%s if %s else %s' % (fast, cond, slow)
+            return fast
+
+    def assign(self, source, lines):
+        name = 't%i' % self.temps
+        self.temps += 1
+        lines.append('%s = %s' % (name, source))
+        return name
+
+    def value(self, token, lines):
+        # returns the name of a local holding the normalized value of token
+        if isinstance(token, MatrixExpr):
+            return self.assign('vm.get(%s)' % self.const(token), lines)
+        elif isinstance(token, Tuple):
+            items = [self.value(arg, lines) for arg in token.contents]
+            return self.assign('[%s]' % ', '.join(items), lines)
+        elif isinstance(token, Base):
+            return self.expression(token, lines)
+        elif isinstance(token, tokens.Value):
+            return self.const(normalize(token.value))
+
+        get = token.__class__.get.im_func
+        if get is tokens.SimpleVar.get.im_func:
+            # most values are ints, which are already normalized
+            name = self.assign('vm.regs[%i]' % token.slot, lines)
+            lines.append('if %s.__class__ is not int: %s = n(%s)' % (name, name, name))
+            return name
+        elif get is tokens.Function.get.im_func and isinstance(token.arg, Tuple):
+            args = self.value(token.arg, lines)
+            return self.assign('n(%s(vm, %s))' % (self.method(token, 'call'), args), lines)
+        elif get is tokens.MathExprFunction.get.im_func and isinstance(token.arg, Tuple) and len(token.arg) == 1:
+            arg = self.value(token.arg.contents[0], lines)
+            return self.assign('n(%s(vm, %s))' % (self.method(token, 'evaluate'), arg), lines)
+
+        return self.assign('vm.get(%s)' % self.const(token), lines)
+
+    def operand(self, operand, temps, lines):
+        if type(operand) is int:
+            return temps[operand]
+
+        return self.value(operand, lines)
+
+    def expression(self, expr, lines):
+        steps, result = expr.program or expr.compile()
+
+        temps = []
+        for token, apply, left, right in steps:
+            if apply is None and isinstance(token, tokens.Stor) and isinstance(right, tokens.SimpleVar)\
+                    and right.__class__.set.im_func is tokens.SimpleVar.set.im_func:
+                # storing to a simple variable doesn't need the tokens
+                left = self.operand(left, temps, lines)
+                lines.append('vm.regs[%i] = %s' % (right.slot, left))
+                temps.append(left)
+                continue
+            elif apply is None:
+                # operators without apply() are handed tokens, with earlier results wrapped in a Value
+                if type(left) is int:
+                    left = 'Value(%s)' % temps[left]
+                else:
+                    left = self.const(left)
+
+                if type(right) is int:
+                    right = 'Value(%s)' % temps[right]
+                else:
+                    right = self.const(right)
+
+                temps.append(self.assign('n(%s(vm, %s, %s))' % (self.method(token, 'run'), left, right), lines))
+                continue
+
+            left = self.operand(left, temps, lines)
+            right = self.operand(right, temps, lines)
+            temps.append(self.assign(self.operation(token, left, right), lines))
+
+        return self.operand(result, temps, lines)
+
+def build(expr):
+    compiler = Compiler()
+    lines = []
+    result = compiler.expression(expr, lines)
+
+    args = ''.join(', %s=%s' % (name, name) for name in sorted(compiler.consts))
+    source = 'def expr(vm%s):\n' % args
+    source += '    n = vm.normalize\n'
+    for line in lines:
+        source += '    %s\n' % line
+    source += '    return %s\n' % result
+
+    namespace = {'Value': tokens.Value, 'V': vector.TYPES}
+    namespace.update(compiler.consts)
+    exec compile(source, '<expression>', 'exec') in namespace
+    return namespace['expr']
@@ -1,6 +1,11 @@
+import gc
+from contextlib import contextmanager
+
 class Error(Exception):
-       def __init__(self, msg):
+       def __init__(self, msg, line=None):
            self.msg = msg
+           # the source line it's about, when it isn't where the vm is
+           self.line = line
 
        def __str__(self):
            return self.msg
@@ -11,6 +16,7 @@ class ReturnError(Exception): pass
 class ParseError(Error): pass
 class ExecutionError(Error): pass
 class ExpressionError(Error): pass
+class CompileError(Error): pass
 
 class Pri:
     # evaluation happens in the following order:
@@ -37,5 +43,29 @@ class Pri:
     BOOL = 5
     SET = 6
 
+def normalize(val):
+    if isinstance(val, complex):
+        if not val.imag:
+            val = val.real
+
+    if isinstance(val, (float)):
+        # TODO: perhaps limit precision here
+        i = int(val)
+        if val == i:
+            val = i
+
+    return val
+
 def is_number(num):
     return str(num).lstrip('-').replace('.', '', 1).isdigit()
+
+@contextmanager
+def gc_paused():
+    # for code which allocates lots of small objects, which would keep triggering the cyclic gc
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
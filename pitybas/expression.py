@@ -1,5 +1,6 @@
 import tokens
 from common import ExpressionError, Pri, is_number
+from matrix import Mat
 
 class Base:
     priority = Pri.NONE
@@ -12,6 +13,8 @@ class Base:
     absorbs = ()
 
     end = None
+    program = None
+    closure = None
 
     def __init__(self, *elements):
         self.contents = []
@@ -22,6 +25,9 @@ class Base:
             self.append(e)
 
     def append(self, token):
+        self.program = None
+        self.closure = None
+
         if self.contents:
             prev = self.contents[-1]
 
@@ -53,6 +59,13 @@ class Base:
         self.raw.append(token)
         self.contents.append(token)
 
+    def __getstate__(self):
+        # compiled forms hold bound methods, and are rebuilt on first use
+        state = self.__dict__.copy()
+        state.pop('program', None)
+        state.pop('closure', None)
+        return state
+
     def extend(self, array):
         for x in array:
             self.append(x)
@@ -153,15 +166,19 @@ class Base:
                     order[p] = [i]
 
         ret = []
-        for p in order:
+        for p in sorted(order):
             ret += order[p]
 
         return ret
 
-    def get(self, vm):
+    def compile(self):
+        # reduces the expression once into a list of (token, apply, left, right) steps
+        # left and right are either tokens, or ints referring to the result of an earlier step
+        # tokens are still evaluated when their operator runs, to keep side effects in the same order
         self.fill()
         self.validate()
 
+        steps = []
         sub = []
         expr = self.contents[:]
         for i in self.order():
@@ -177,9 +194,51 @@ class Base:
             left = expr.pop(i-1)
 
             token = expr[i-1]
-            expr[i-1] = tokens.Value(token.run(vm, left, right))
+            steps.append((token, getattr(token, 'apply', None), left, right))
+            expr[i-1] = len(steps) - 1
+
+        self.program = steps, expr[0]
+        return self.program
+
+    def build(self):
+        from closures import build
+        self.closure = build(self)
+        return self.closure
+
+    def get(self, vm):
+        if vm.closures:
+            return (self.closure or self.build())(vm)
+
+        steps, result = self.program or self.compile()
+
+        values = []
+        for token, apply, left, right in steps:
+            if apply is None:
+                # operators without apply() (such as Store) are handed tokens
+                if type(left) is int:
+                    left = tokens.Value(values[left])
+                if type(right) is int:
+                    right = tokens.Value(values[right])
+
+                values.append(token.run(vm, left, right))
+                continue
+
+            if type(left) is int:
+                left = vm.normalize(values[left])
+            else:
+                left = vm.get(left)
+
+            if type(right) is int:
+                right = vm.normalize(values[right])
+            else:
+                right = vm.get(right)
+
+            values.append(apply(vm, left, right))
 
-        return vm.get(expr[0])
+        if type(result) is int:
+            return vm.normalize(values[result])
+
+        return vm.get(result)
 
     def finish(self):
         self.finished = True
@@ -280,6 +339,45 @@ class MatrixExpr(Arguments):
     priority = Pri.NONE
     end = ']'
 
+    def append(self, expr):
+        # rows written next to each other, like [[1,2][3,4]], are separate elements instead of an implied multiplication
+        if isinstance(expr, MatrixExpr) and self.contents:
+            last = self.contents[-1]
+            if isinstance(last, Base) and len(last.contents) == 1 and isinstance(last.contents[0], MatrixExpr):
+                last.finish()
+
+        Arguments.append(self, expr)
+
+    def flatten(self):
+        # the brackets are significant, so [[5]] is still a matrix
+        return self
+
+    def get(self, vm):
+        # the outer brackets hold the rows, which are evaluated as plain lists
+        rows = Arguments.get(self, vm)
+        if rows and all(isinstance(row, list) for row in rows):
+            return Mat.from_rows(rows)
+
+        return rows
+
     def __repr__(self):
         return 'M[%s]' % (', '.join(repr(expr) for expr in self.contents))
 
+def precompile(token):
+    '''
+    compiles every expression under a token ahead of time, so running them doesn't change them
+    expressions which don't compile are left to raise their error when they run
+    '''
+    stack = [token]
+    while stack:
+        cur = stack.pop()
+        if isinstance(cur, Base):
+            if not isinstance(cur, Tuple) and cur.program is None:
+                try:
+                    cur.compile()
+                except Exception:
+                    pass
+
+            stack.extend(cur.contents)
+        elif getattr(cur, 'arg', None) is not None:
+            stack.append(cur.arg)
@@ -1,12 +1,15 @@
-from collections import defaultdict
+from collections import defaultdict, deque
 import decimal
 import os
-import time
 import traceback
 
 from parse import Parser, ParseError
-from tokens import EOF, Value, REPL
-from common import ExecutionError, StopError, ReturnError
+from tokens import EOF, Value, REPL, Ans, REGISTERS, SLOTS, DEFAULTS
+from common import ExecutionError, StopError, ReturnError, normalize
+from matrix import Mat
+from numeric import MODES as NUMERIC
+from program import Program
+from registry import Registry
 
 from pitybas.io.simple import IO
 from expression import Base
@@ -14,39 +17,66 @@ from expression import Base
 class Interpreter(object):
     @classmethod
     def from_string(cls, string, *args, **kwargs):
-        code = Parser(string).parse()
-        return Interpreter(code, *args, **kwargs)
+        return Interpreter(Program.from_string(string), *args, **kwargs)
 
     @classmethod
     def from_file(cls, filename, *args, **kwargs):
-        string = open(filename, 'r').read().decode('utf8')
-        vm = Interpreter.from_string(string, *args, **kwargs)
+        program = Program.from_file(filename, kwargs.get('cache', True))
+        vm = Interpreter(program, *args, **kwargs)
         vm.name = os.path.basename(filename)
         return vm
 
-    def __init__(self, code, history=10, io=None, name=None):
+    def __init__(self, code, history=10, io=None, name=None, evaluator='tree', numeric='decimal', cache=True,
+                 path=None, registry=None, max_frames=1000, trace=False):
         if not io: io = IO
         self.io = io(self)
 
+        # evaluator is either 'tree' (walk each expression's steps) or 'closure' (compile them to python)
+        self.closures = (evaluator == 'closure')
+        # numeric is a mode from numeric.py, which is used for multiplication, division and display rounding
+        self.numeric = NUMERIC[numeric]()
+        # finds the programs run by pgrm, and is shared with their vms
+        self.registry = registry or Registry(path, cache)
+        # pgrm calls push the caller's state here, and Return or EOF pops it
+        self.frames = []
+        self.max_frames = max_frames
+
         self.name = name
-        self.code = code
-        self.code.append([EOF()])
+        # programs are shared with other vms, so nothing here may change them
+        if not isinstance(code, Program):
+            code = Program(code)
+
+        self.program = code
+        self.code, self.jumps, self.labels = code.code, code.jumps, code.labels
+        self.diagnostics = code.diagnostics
         self.line = 0
         self.col = 0
         self.expression = None
         self.blocks = []
-        self.running = []
-        self.history = []
+        # (row, col, token) of the statement being run, for blocks that need their own position
+        self.current = None
+        # set while a pgrm frame is pushed or popped, when the program and position don't match yet
+        self.switching = False
+        # the last few tokens run, which are only recorded when tracing
+        self.trace = trace
+        self.history = deque(maxlen=history)
         self.hist_len = history
 
+        self.regs = DEFAULTS[:]
         self.vars = {}
         self.lists = defaultdict(list)
         self.matrix = {}
         self.fixed = -1
+        # the current value of each running For loop, by id of its token
+        self.loops = {}
 
+        # counts the expressions evaluated, so the REPL can tell when Ans changed
         self.serial = 0
         self.repl_serial = 0
 
+    def index(self, strict=False):
+        self.jumps, self.labels, self.diagnostics = Parser.index(self.code, strict)
+
     def cur(self):
         return self.code[self.line][self.col]
 
@@ -64,6 +94,14 @@ class Interpreter(object):
         return self.cur()
 
     def get_var(self, var, default=None):
+        if var in SLOTS:
+            value = self.regs[SLOTS[var]]
+            if value is not None:
+                return value
+            elif default is not None:
+                return default
+            raise KeyError(var)
+
         if var not in self.vars and default is not None:
             return default
         return self.vars[var]
@@ -72,9 +110,21 @@ class Interpreter(object):
         if isinstance(value, (Value, Base)):
             value = value.get(self)
 
-        self.vars[var] = value
+        if var in SLOTS:
+            self.regs[SLOTS[var]] = value
+        else:
+            self.vars[var] = value
         return value
 
+    def variables(self):
+        # registers still holding their default are left out
+        ret = dict(self.vars)
+        for name, value, default in zip(REGISTERS, self.regs, DEFAULTS):
+            if value != default:
+                ret[name] = value
+
+        return ret
+
     def get_matrix(self, name):
         return self.matrix[name]
 
@@ -88,8 +138,8 @@ class Interpreter(object):
         self.lists[name] = value
 
     def push_block(self, block=None):
-        if not block and self.running:
-            block = self.running[-1]
+        if not block:
+            block = self.current
 
         if block:
             self.blocks.append(block)
@@ -138,67 +188,67 @@ class Interpreter(object):
             raise ExecutionError('cannot goto (%i, %i)' % (row, col))
 
     def get(self, *var):
-        ret = []
-        for v in var:
-            val = v.get(self)
-            if isinstance(val, complex):
-                if not val.imag:
-                    val = val.real
-
-            if isinstance(val, (float)):
-                # TODO: perhaps limit precision here
-                i = int(val)
-                if val == i:
-                    val = i
-
-            ret.append(val)
+        if len(var) == 1:
+            return self.normalize(var[0].get(self))
 
-        if len(ret) == 1:
-            return ret[0]
+        return [self.normalize(v.get(self)) for v in var]
 
-        return ret
+    normalize = staticmethod(normalize)
 
     def disp_round(self, num):
+        if isinstance(num, list):
+            return [self.disp_round(x) for x in num]
+        elif isinstance(num, Mat):
+            return Mat(num.rows, num.cols, [self.disp_round(x) for x in num.data])
+
         if not isinstance(num, (decimal.Decimal, int, long, float, complex)):
             return num
 
         if self.fixed < 0:
-            return num
+            return self.numeric.round(num)
         else:
             return round(num, self.fixed)
 
     def run(self, cur):
-        self.history.append((self.line, self.col, cur))
-        self.history = self.history[-self.hist_len:]
-
-        cur.line, cur.col = self.line, self.col
+        if self.trace:
+            self.history.append((self.line, self.col, cur))
 
+        # only read by a token before it runs anything else, so nested statements can overwrite it
+        self.current = (self.line, self.col, cur)
         if cur.can_run:
-            self.running.append((self.line, self.col, cur))
             self.inc()
             cur.run(self)
-            self.running.pop()
         elif cur.can_get:
             self.inc()
-            self.set_var('Ans', cur.get(self))
-            self.serial = time.time()
+            self.regs[Ans.slot] = cur.get(self)
+            self.serial += 1
         else:
             raise ExecutionError('cannot seem to run token: %s' % cur)
 
     def execute(self):
-        with self.io:
-            try:
-                while not isinstance(self.cur(), EOF):
-                    cur = self.cur()
-                    self.run(cur)
-            except StopError, e:
-                if e.message:
-                    print
-                    print 'Stopped:', e.message
-            except ReturnError, e:
-                if e.message:
-                    print
-                    print 'Returned:', e.message
+        # the io is closed before the messages are printed, so buffered output comes first
+        try:
+            with self.io:
+                run, cur = self.run, self.cur
+                while True:
+                    token = cur()
+                    if token.__class__ is EOF:
+                        # the end of a pgrm returns to its caller
+                        if not self.frames:
+                            break
+
+                        self.pop_frame()
+                        continue
+
+                    run(token)
+        except StopError, e:
+            if e.message:
+                print
+                print 'Stopped:', e.message
+        except ReturnError, e:
+            if e.message:
+                print
+                print 'Returned:', e.message
 
     def print_tokens(self):
         for line in self.code:
@@ -222,14 +272,29 @@ class Interpreter(object):
         if self.name:
             print '-===[ Dumping {} ]===-'.format(self.name)
 
-        if self.history:
+        if self.frames:
+            print
+            print '-===[ Called from ]===-'
+            for frame in reversed(self.frames[-10:]):
+                name, program, code, jumps, labels, row, col = frame[:7]
+                print '{} [{}, {}]'.format(name, row, col)
+
+            if len(self.frames) > 10:
+                print '... {} more'.format(len(self.frames) - 10)
+
+        history = list(self.history)[-num:]
+        if not history and self.current:
+            # without tracing, the statement that was running is all there is
+            history = [self.current]
+
+        if history:
             print
             print '-===[ Stacktrace ]===-'
 
-        for row, col, cur in self.history[-num:]:
+        for row, col, cur in history:
             print ('[{}, {}]:'.format(row, col)).ljust(9), repr(cur).replace("u'", '').replace("'", '')
 
-        if self.history:
+        if history:
             print
 
         print '-===[ Code (row {}, col {}) ]===-'.format(self.line, self.col)
@@ -241,23 +306,54 @@ class Interpreter(object):
             print
             print '-===[ Variable Dump ]===-'
             import pprint
-            pprint.pprint(self.vars)
+            pprint.pprint(self.variables())
             print
 
+    def push_frame(self, name, program):
+        if len(self.frames) >= self.max_frames:
+            raise ExecutionError('too many nested pgrm calls (limit is %i)' % self.max_frames)
+
+        self.switching = True
+        self.frames.append((self.name, self.program, self.code, self.jumps, self.labels,
+                            self.line, self.col, self.blocks, self.loops, self.current))
+        self.name, self.program = name, program
+        self.code, self.jumps, self.labels = program.code, program.jumps, program.labels
+        self.line = self.col = 0
+        self.blocks = []
+        self.loops = {}
+        self.expression = None
+        self.current = None
+        self.switching = False
+
+    def pop_frame(self):
+        self.switching = True
+        (self.name, self.program, self.code, self.jumps, self.labels,
+         self.line, self.col, self.blocks, self.loops, self.current) = self.frames.pop()
+        self.expression = None
+        self.switching = False
+
     def run_pgrm(self, name):
-        for ref in os.listdir('.'):
-            if ref.endswith('.bas'):
-                test = ref.rsplit('.', 1)[0]
-                if test.lower() == name.lower():
-                    sub = Interpreter.from_file(ref)
-                    sub.execute()
-                    return
-        raise ExecutionError('pgrm{} not found'.format(name))
+        # the program runs on this vm, sharing its variables, once the current token returns
+        self.push_frame(name, self.registry.load(name))
+
+    def call(self, name):
+        # runs a program to completion, for callers outside of execute() like compiled modules
+        depth = len(self.frames)
+        self.run_pgrm(name)
+        while len(self.frames) > depth:
+            cur = self.cur()
+            if isinstance(cur, EOF):
+                self.pop_frame()
+            else:
+                self.run(cur)
 
 class Repl(Interpreter):
     def __init__(self, code=[], **kwargs):
         super(Repl, self).__init__(code, **kwargs)
+        # the REPL adds each line it reads to the code, so it needs its own copy
+        self.code = self.code[:]
         self.code.insert(-2, [REPL()])
+        self.index()
 
     def execute(self):
         while not isinstance(self.cur(), EOF):
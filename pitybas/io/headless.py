@@ -0,0 +1,132 @@
+import json
+import sys
+
+from pitybas.parse import Parser
+from pitybas.common import ParseError, StopError
+
+class IO:
+    '''
+    for batch runs: output is written to a stream in large chunks, and the terminal is never touched
+    input is read a line at a time from stdin, and running out of it stops the program
+    given a Script from io/script.py, answers, menu choices and keys come from it instead
+
+    with json=True, each Disp, Output( and ClrHome is written as a line of JSON:
+    {"kind": "disp", "output" or "clear", "row": row or null, "col": col or null, "text": text, "step": n}
+    where step counts the records written so far
+    '''
+    def __init__(self, vm, out=None, inp=None, json=False, buffer=65536, script=None):
+        self.vm = vm
+        self.out = out or sys.stdout
+        self.inp = inp or sys.stdin
+        self.json = json
+        self.script = script
+        self.buffer = buffer
+
+        self.chunks = []
+        self.size = 0
+        self.step = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.flush()
+
+    def write(self, data):
+        if isinstance(data, unicode):
+            data = data.encode('utf8')
+
+        self.chunks.append(data)
+        self.size += len(data)
+        if self.size >= self.buffer:
+            self.flush()
+
+    def flush(self):
+        if self.chunks:
+            self.out.write(''.join(self.chunks))
+            self.chunks = []
+            self.size = 0
+
+        self.out.flush()
+
+    def record(self, kind, text='', row=None, col=None):
+        if self.json:
+            self.write(json.dumps({'kind': kind, 'row': row, 'col': col, 'text': text, 'step': self.step}, sort_keys=True) + '\n')
+        elif kind == 'clear':
+            self.write('-'*16 + '\n')
+        else:
+            self.write(text + '\n')
+
+        self.step += 1
+
+    def readline(self, msg=''):
+        # prompts are only shown as plain text, followed by a scripted answer
+        if msg and not self.json:
+            self.write(msg + ' ')
+
+        if self.script:
+            line = self.script.input()
+            if not self.json:
+                self.write(line + '\n')
+            return line
+
+        # everything written so far goes out before waiting
+        self.flush()
+        line = self.inp.readline()
+        if not line:
+            raise StopError('ran out of input')
+
+        return line.rstrip('\r\n').decode('utf8')
+
+    def clear(self):
+        self.record('clear')
+
+    def input(self, msg, is_str=False):
+        while True:
+            line = self.readline(msg)
+            if is_str:
+                return line
+
+            try:
+                return Parser.parse_line(self.vm, line)
+            except ParseError:
+                self.record('disp', 'ERR:DATA')
+
+    def getkey(self):
+        if self.script:
+            return self.script.key()
+
+        # no key is ever pressed
+        return 0
+
+    def output(self, x, y, msg):
+        self.record('output', unicode(msg), x, y)
+
+    def disp(self, msg=''):
+        self.record('disp', unicode(msg))
+
+    def pause(self, msg=''):
+        # nobody is watching, so there's nothing to wait for
+        if msg: self.disp(msg)
+
+    def menu(self, menu):
+        # menu is a tuple of (title, (desc, label)),
+        lookup = []
+        for title, entries in menu:
+            self.record('disp', u'-[ %s ]-' % self.vm.get(title))
+            for name, label in entries:
+                lookup.append(label)
+                self.record('disp', u'%i: %s' % (len(lookup), self.vm.get(name)))
+
+        while True:
+            if self.script:
+                choice = unicode(self.script.menu())
+                if not self.json:
+                    self.write('choice? %s\n' % choice)
+            else:
+                choice = self.readline('choice?')
+
+            if choice.isdigit() and 0 < int(choice) <= len(lookup):
+                return lookup[int(choice)-1]
+
+            self.record('disp', 'invalid choice')
@@ -0,0 +1,55 @@
+from pitybas.io import headless
+from pitybas.io.screen import Screen
+
+class IO(headless.IO):
+    '''
+    a headless IO which keeps the home screen in memory, as vt100 would show it
+    Disp, Output( and ClrHome only change the Screen, and snapshots of it are written instead:
+    with snapshot='step' after each of them, or with snapshot='end' once the program stops
+
+    a snapshot is the grid in a box, or with json=True a line of JSON:
+    {"kind": "screen", "row": row, "col": col, "text": rows joined by newlines, "step": n}
+    where row and col are where Disp writes next
+    input, prompts and menus are handled as in headless, and written between snapshots
+    '''
+    def __init__(self, vm, snapshot='end', width=16, height=8, **kwargs):
+        headless.IO.__init__(self, vm, **kwargs)
+        if not snapshot in ('end', 'step'):
+            raise ValueError('unknown snapshot mode: %s' % snapshot)
+
+        self.snapshot = snapshot
+        self.screen = Screen(width, height)
+
+    def __exit__(self, *args):
+        if self.snapshot == 'end':
+            self.dump()
+
+        headless.IO.__exit__(self, *args)
+
+    def dump(self):
+        screen = self.screen
+        if self.json:
+            self.record('screen', screen.text(), screen.row, screen.col)
+        else:
+            border = u'+%s+' % ('-' * screen.width)
+            rows = [u'|%s|' % ''.join(line) for line in screen.lines]
+            self.record('screen', u'\n'.join([border] + rows + [border]))
+
+    def changed(self):
+        if self.snapshot == 'step':
+            self.dump()
+
+    def clear(self):
+        self.screen.clear()
+        self.changed()
+
+    def output(self, row, col, msg):
+        self.screen.output(row, col, msg)
+        self.changed()
+
+    def disp(self, msg=''):
+        if isinstance(msg, (complex, int, float)):
+            msg = str(msg).rjust(self.screen.width)
+
+        self.screen.write(msg)
+        self.changed()
@@ -0,0 +1,77 @@
+class Screen:
+    '''
+    the calculator's home screen as a grid of characters, with a cursor where Disp writes next
+    rows and columns count from 1, text wraps at the right edge and Disp scrolls at the bottom
+    the grid is only kept in memory, and vt100 draws it to the terminal
+    '''
+    def __init__(self, width=16, height=8):
+        self.width = width
+        self.height = height
+        self.clear()
+
+        self.row, self.col = 1, 1
+        self.pos_stack = []
+
+    def push(self):
+        self.pos_stack.append((self.row, self.col))
+
+    def pop(self):
+        self.row, self.col = self.pos_stack.pop()
+
+    def clear(self):
+        self.row, self.col = 1, 1
+        self.lines = []
+        for i in xrange(self.height):
+            self.lines.append([' ']*self.width)
+
+    def scroll(self):
+        self.lines.pop(0)
+        self.lines.append([' ']*self.width)
+        self.row = max(1, self.row - 1)
+
+    def move(self, row, col):
+        self.row, self.col = row, col
+
+    def wrap(self, msg):
+        # a newline, as in a matrix, starts the next row
+        lines = []
+        width = self.width - self.col + 1
+        for part in unicode(msg).split('\n'):
+            lines.append(part[:width])
+            part = part[width:]
+            while part:
+                lines.append(part[:self.width])
+                part = part[self.width:]
+
+            width = self.width
+
+        return lines
+
+    def write(self, msg, scroll=True):
+        row, col = self.row, self.col
+        for line in self.wrap(msg):
+            if row > self.height:
+                row -= 1
+
+                if scroll:
+                    self.scroll()
+                else:
+                    break
+
+            for char in line:
+                self.lines[row-1][col-1] = char
+                col += 1
+
+            col = 1
+            row += 1
+
+        self.row, self.col = row, col
+
+    def output(self, row, col, msg):
+        old = self.row, self.col
+        self.move(row, col)
+        self.write(msg)
+        self.row, self.col = old
+
+    def text(self):
+        return u'\n'.join(u''.join(line) for line in self.lines)
@@ -0,0 +1,95 @@
+'''
+answers for Input, Prompt, Menu( and getKey, so interactive programs can run unattended
+
+a script has one command per line, and blank lines and lines starting with # are ignored:
+
+    input TEXT      the next answer to Input or Prompt
+    menu N          the next Menu( choice, counting from 1
+    key KEY ...     the next getKey results, each a key name from the vt100 keycodes table or a number
+    idle N          the next N getKey calls return 0, as if no key was pressed
+    sleep SECONDS   getKey returns 0 until SECONDS have passed since it reached this line
+
+answers, menu choices and keys are each used in order, independently of each other
+when a program asks for more than the script has, it stops
+'''
+import time
+from collections import deque
+
+from pitybas.common import ParseError, StopError
+from pitybas.io.vt100 import keycodes
+
+class Sleep:
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.until = None
+
+    def waiting(self):
+        now = time.time()
+        if self.until is None:
+            self.until = now + self.seconds
+
+        return now < self.until
+
+class Script:
+    def __init__(self, lines=()):
+        self.inputs = deque()
+        self.menus = deque()
+        self.keys = deque()
+
+        for number, line in enumerate(lines):
+            line = line.rstrip('\r\n')
+            if not line.strip() or line.lstrip().startswith('#'):
+                continue
+
+            command, _, arg = line.lstrip().partition(' ')
+            try:
+                self.add(command, arg)
+            except ValueError, e:
+                raise ParseError('script line %i: %s' % (number + 1, e))
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename) as f:
+            return cls(line.decode('utf8') for line in f)
+
+    def add(self, command, arg):
+        if command == 'input':
+            self.inputs.append(arg)
+        elif command == 'menu':
+            self.menus.append(int(arg))
+        elif command == 'key':
+            for name in arg.split():
+                if name in keycodes:
+                    self.keys.append(keycodes[name])
+                elif name.isdigit():
+                    self.keys.append(int(name))
+                else:
+                    raise ValueError('unknown key: %s' % name)
+        elif command == 'idle':
+            self.keys.extend([0] * int(arg))
+        elif command == 'sleep':
+            self.keys.append(Sleep(float(arg)))
+        else:
+            raise ValueError('unknown command: %s' % command)
+
+    def next(self, queue, what):
+        if not queue:
+            raise StopError('script ran out of %s' % what)
+
+        return queue.popleft()
+
+    def input(self):
+        return self.next(self.inputs, 'input')
+
+    def menu(self):
+        return self.next(self.menus, 'menu choices')
+
+    def key(self):
+        # idle counts getKey calls, while sleep holds the keys back for a while however often they're polled
+        while self.keys and isinstance(self.keys[0], Sleep):
+            if self.keys[0].waiting():
+                return 0
+
+            self.keys.popleft()
+
+        return self.next(self.keys, 'keys')
@@ -5,7 +5,9 @@ except ImportError:
 
 from pitybas.parse import Parser
 from pitybas.common import ParseError
+from pitybas.io.screen import Screen
 
+import os
 import select
 import sys
 import termios
@@ -50,176 +52,183 @@ keycodes = {
     'enter': 105
 }
 
-class Delayed:
+class VT(Screen):
     '''
-    ensure at least duration time between __enter__ and __exit__
+    a Screen drawn to the terminal
+    render() compares the grid to what it drew last, and writes only the cells which changed in one write
+    with fps, a render sooner than 1/fps after the last frame is skipped, and a later one draws its changes
     '''
-    def __init__(self, duration):
-        self.duration = duration
-
-    def __enter__(self):
-        self.start = time.time()
-
-    def __exit__(self, *args):
-        diff = self.duration - (time.time() - self.start)
-        if diff > 0:
-            time.sleep(diff)
-
-class SafeIO:
-    def __init__(self, fd):
-        self.fd = fd
-
-    def __enter__(self):
-        self.old = termios.tcgetattr(self.fd)
-
-    def __exit__(self, *args):
-        termios.tcsetattr(self.fd, termios.TCSANOW, self.old)
-
-class VT:
-    def __init__(self, width=16, height=8):
-        self.width = width
-        self.height = height
-        self.clear()
-
-        self.row, self.col = 1, 1
-        self.pos_stack = []
-
-    def push(self):
-        self.pos_stack.append((self.row, self.col))
-
-    def pop(self):
-        self.row, self.col = self.pos_stack.pop()
+    # unchanged cells between two changes which are rewritten rather than moving the cursor past them
+    GAP = 6
+
+    def __init__(self, width=16, height=8, fps=None):
+        Screen.__init__(self, width, height)
+        self.fps = fps
+        self.last = 0
+        # what the terminal shows, or None to redraw everything
+        self.drawn = None
+        # rows scrolled off since the last frame
+        self.scrolled = 0
+        # whether the fps limit skipped a frame which changed the screen
+        self.pending = False
+        # the terminal's attributes while keys are read raw
+        self.term = None
 
     def e(self, *seqs):
         for seq in seqs:
             sys.stdout.write('\033'+seq)
 
-    def clear(self, reset=True):
-        self.e('[2J', '[H')
-        self.row, self.col = 1, 1
-        if reset:
-            self.lines = []
-            for i in xrange(self.height):
-                self.lines.append([' ']*self.width)
-
     def scroll(self):
-        self.lines.pop(0)
-        self.lines.append([' ']*self.width)
-        self.row = max(1, self.row - 1)
-
-    def flush(self):
-        self.clear(reset=False)
-        data = '\n'.join(''.join(line) for line in self.lines) + '\n'
-        sys.stdout.write(
-            data.encode(sys.stdout.encoding, 'replace')
-        )
-
-    def move(self, row, col):
-        self.row, self.col = row, col
-        self.e('[%i;%iH' % (row, col))
-
-    def wrap(self, msg):
-        msg = unicode(msg)
-        first = self.width - self.col + 1
-        first, msg = msg[:first], msg[first:]
-        lines = [first]
-        while msg:
-            lines.append(msg[:self.width])
-            msg = msg[self.width:]
-
-        return lines
-
-    def write(self, msg, scroll=True):
-        row, col = self.row, self.col
-        self.e('[%i;%iH' % (row, col))
-
-        for line in self.wrap(msg):
-            if row > self.height:
-                row -= 1
-
-                if scroll:
-                    self.scroll()
-                    row, col = self.row, self.col
-                    self.flush()
-                    self.move(row, 1)
-                else:
-                    break
-
-            for char in line:
-                self.lines[row-1][col-1] = char
-                char = char.encode(sys.stdout.encoding, 'replace')
-                sys.stdout.write(char)
-                col += 1
-
-            col = 1
-            row += 1
-            sys.stdout.write('\n')
-
-        self.row, self.col = row, col
-
-    def output(self, row, col, msg):
-        self.e('7')
-        old = self.row, self.col
-        self.move(row, col)
-        self.write(msg)
-
-        self.row, self.col = old
-        self.e('8')
-
-    def getch(self):
+        Screen.scroll(self)
+        self.scrolled += 1
+
+    def invalidate(self):
+        self.drawn = None
+
+    def due(self):
+        # seconds until a skipped frame can be drawn, or None if there isn't one
+        if not self.pending:
+            return None
+
+        return max(0, self.last + 1.0 / self.fps - time.time())
+
+    def render(self, force=False):
+        now = time.time()
+        if self.fps and not force and now - self.last < 1.0 / self.fps:
+            self.pending = self.pending or self.scrolled or self.lines != self.drawn
+            return
+
+        self.pending = False
+        if self.lines == self.drawn:
+            self.scrolled = 0
+            return
+
+        out = []
+        width, height = self.width, self.height
+        if self.drawn is None or self.scrolled >= height:
+            out.append(u'\033[2J')
+            drawn = [[' ']*width for i in xrange(height)]
+        elif self.scrolled:
+            # the terminal moves the rows up itself, inside a scroll region as tall as the screen
+            out.append(u'\033[1;%ir\033[%i;1H%s\033[r' % (height, height, '\n' * self.scrolled))
+            drawn = self.drawn[self.scrolled:] + [[' ']*width for i in xrange(self.scrolled)]
+        else:
+            drawn = self.drawn
+
+        for row, (line, old) in enumerate(zip(self.lines, drawn)):
+            if line == old:
+                continue
+
+            col = 0
+            while col < width:
+                if line[col] == old[col]:
+                    col += 1
+                    continue
+
+                start = end = col
+                while col < width and col - end <= self.GAP:
+                    if line[col] != old[col]:
+                        end = col
+                    col += 1
+
+                out.append(u'\033[%i;%iH' % (row + 1, start + 1))
+                out.append(u''.join(line[start:end+1]))
+
+        self.drawn = [list(line) for line in self.lines]
+        self.scrolled = 0
+        self.last = now
+
+        sys.stdout.write(u''.join(out).encode(sys.stdout.encoding or 'utf8', 'replace'))
+        sys.stdout.flush()
+
+    def raw(self):
+        # keys are read as they're pressed, without echo, until cooked()
+        if self.term is None and sys.stdin.isatty():
+            fd = sys.stdin.fileno()
+            self.term = termios.tcgetattr(fd)
+            tty.setcbreak(fd)
+
+    def cooked(self):
+        if self.term is not None:
+            termios.tcsetattr(sys.stdin.fileno(), termios.TCSADRAIN, self.term)
+            self.term = None
+
+    def getch(self, timeout=0):
+        # waits up to timeout seconds for a key, and returns as soon as one is pressed
+        self.raw()
         fd = sys.stdin.fileno()
 
-        with SafeIO(fd):
-            tty.setraw(fd)
+        ins, _, _ = select.select([fd], [], [], timeout)
+        if not ins:
+            return
 
-            with Delayed(0.1):
-                ins, _, _ = select.select([sys.stdin], [], [], 0.1)
-            if not ins:
-                return
+        ch = os.read(fd, 1)
+        if not ch:
+            # stdin is closed, so no key will ever come
+            time.sleep(timeout)
+            return
 
-            ch = sys.stdin.read(1)
-            if ch == '\003':
-                raise KeyboardInterrupt
+        if ch == '\003':
+            raise KeyboardInterrupt
 
-            if ch == '\033':
-                # control sequence
-                ch = sys.stdin.read(1)
-                if ch == '[':
-                    ch = sys.stdin.read(1)
-                    if ch == 'A':
-                        return 'up'
-                    elif ch == 'B':
-                        return 'down'
-                    elif ch == 'C':
-                        return 'right'
-                    elif ch == 'D':
-                        return 'left'
+        if ch in '\r\n':
+            return 'enter'
 
-                return None
+        if ch == '\033':
+            # control sequence
+            ch = os.read(fd, 1)
+            if ch == '[':
+                ch = os.read(fd, 1)
+                if ch == 'A':
+                    return 'up'
+                elif ch == 'B':
+                    return 'down'
+                elif ch == 'C':
+                    return 'right'
+                elif ch == 'D':
+                    return 'left'
 
-            return ch
+            return None
+
+        return ch
 
 class IO:
-    def __init__(self, vm):
+    '''
+    getKey returns at once for the first IDLE_POLLS calls which find no key
+    after that, each call waits for a key twice as long as the last, up to IDLE_WAIT seconds
+    so a program idling in a getKey loop sleeps on select, while one that draws between polls runs at full speed
+    '''
+    IDLE_POLLS = 20
+    IDLE_WAIT = 0.1
+
+    def __init__(self, vm, fps=None):
         self.vm = vm
-        self.vt = VT()
+        self.vt = VT(fps=fps)
+        # getKey calls in a row which returned 0, with nothing drawn in between
+        self.idle = 0
 
     def __enter__(self):
         self.vt.e('[?25l')
+        self.vt.render(force=True)
         return self
 
     def __exit__(self, *args):
-        self.vt.e('[?25h')
+        self.vt.cooked()
+        self.vt.render(force=True)
+        self.vt.e('[%i;1H' % (self.vt.height + 1), '[?25h')
 
     def clear(self):
+        self.idle = 0
         self.vt.clear()
+        self.vt.render()
 
     def input(self, msg, is_str=False):
         # TODO: implement this in VT terms
         while True:
             try:
-                self.vt.push()
-                self.vt.move(9, 1)
+                self.vt.cooked()
+                self.vt.render(force=True)
+                self.vt.e('[%i;1H' % (self.vt.height + 1))
 
                 if msg:
                     print msg,
@@ -228,8 +237,9 @@ class IO:
                 line = raw_input()
                 self.vt.e('[?25l')
 
-                self.vt.flush()
-                self.vt.pop()
+                # the prompt is below the screen, so it's cleared by a full redraw
+                self.vt.invalidate()
+                self.vt.render(force=True)
                 if not is_str:
                     val = Parser.parse_line(self.vm, line)
                 else:
@@ -241,21 +251,39 @@ class IO:
                 print
 
     def getkey(self):
-        key = self.vt.getch()
+        self.vt.render()
+
+        timeout = 0
+        if self.idle >= self.IDLE_POLLS:
+            timeout = min(self.IDLE_WAIT, 0.001 * 2 ** min(self.idle - self.IDLE_POLLS, 7))
+
+        # a skipped frame is drawn once it's due, rather than after the rest of the wait
+        due = self.vt.due()
+        if due is not None:
+            timeout = min(timeout, due)
+
+        key = self.vt.getch(timeout)
+        if due is not None:
+            self.vt.render()
         if key in keycodes:
+            self.idle = 0
             return keycodes[key]
         else:
+            self.idle += 1
             return 0
 
     def output(self, row, col, msg):
+        self.idle = 0
         self.vt.output(row, col, msg)
-        self.vt.flush()
+        self.vt.render()
 
     def disp(self, msg=''):
         if isinstance(msg, (complex, int, float)):
             msg = str(msg).rjust(16)
 
+        self.idle = 0
         self.vt.write(msg)
+        self.vt.render()
 
     def pause(self, msg=''):
         if msg: self.disp(msg)
@@ -267,7 +295,8 @@ class IO:
 
         lookup = []
         while True:
-            self.vt.clear(reset=False)
+            self.vt.cooked()
+            self.vt.e('[2J', '[H')
             i = 1
 
             for title, entries in menu:
@@ -283,7 +312,8 @@ class IO:
             print
             if choice.isdigit() and 0 < int(choice) <= len(lookup):
                 label = lookup[int(choice)-1]
-                self.vt.flush()
+                self.vt.invalidate()
+                self.vt.render(force=True)
                 return label
             else:
                 print 'invalid choice'
@@ -0,0 +1,286 @@
+# matrices are stored as a flat row-major list, and handed to numpy for the O(n^3) operations when it's installed
+import random
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from common import ExecutionError, normalize
+
+# matrices with fewer elements than this aren't worth converting to numpy arrays
+THRESHOLD = 64
+
+# pivots smaller than this are treated as zero
+EPSILON = 1e-12
+
+def clean(x):
+    # floats are rounded to the 14 significant digits of the calculator,
+    # and values within EPSILON of an integer are usually rounding noise from elimination
+    if isinstance(x, float):
+        x = float('%.14g' % x)
+        i = round(x)
+        if abs(x - i) < EPSILON:
+            x = i
+    return normalize(x)
+
+class Mat(object):
+    def __init__(self, rows, cols, data=None):
+        if rows < 1 or cols < 1:
+            raise ExecutionError('invalid matrix dimensions: %ix%i' % (rows, cols))
+
+        self.rows = rows
+        self.cols = cols
+        if data is None:
+            data = [0] * (rows * cols)
+        self.data = data
+
+    @classmethod
+    def from_rows(cls, rows):
+        if not rows or not all(isinstance(row, list) for row in rows):
+            raise ExecutionError('a matrix needs to be a list of rows')
+
+        cols = len(rows[0])
+        data = []
+        for row in rows:
+            if len(row) != cols:
+                raise ExecutionError('matrix rows need to be the same length')
+            data += row
+
+        return cls(len(rows), cols, data)
+
+    @classmethod
+    def from_array(cls, arr):
+        return cls(arr.shape[0], arr.shape[1], [clean(x) for x in arr.flat])
+
+    @classmethod
+    def identity(cls, n):
+        m = cls(n, n)
+        for i in xrange(n):
+            m.data[i * n + i] = 1
+        return m
+
+    @classmethod
+    def random(cls, rows, cols):
+        return cls(rows, cols, [random.randint(-9, 9) for i in xrange(rows * cols)])
+
+    def array(self):
+        return numpy.array(self.data, dtype=float).reshape(self.rows, self.cols)
+
+    def use_numpy(self):
+        return numpy is not None and len(self.data) >= THRESHOLD
+
+    def tolist(self):
+        c = self.cols
+        return [self.data[i:i + c] for i in xrange(0, len(self.data), c)]
+
+    def copy(self):
+        return Mat(self.rows, self.cols, self.data[:])
+
+    @property
+    def dim(self):
+        return [self.rows, self.cols]
+
+    def index(self, row, col):
+        # row and col are 1-based, like the calculator
+        if not (1 <= row <= self.rows and 1 <= col <= self.cols):
+            raise ExecutionError('matrix index out of range: (%s, %s)' % (row, col))
+
+        return (row - 1) * self.cols + col - 1
+
+    def get(self, row, col):
+        return self.data[self.index(row, col)]
+
+    def set(self, row, col, value):
+        self.data[self.index(row, col)] = value
+
+    def resize(self, rows, cols):
+        # keeps the top left corner and pads with zeros
+        m = Mat(rows, cols)
+        for y in xrange(min(rows, self.rows)):
+            for x in xrange(min(cols, self.cols)):
+                m.data[y * cols + x] = self.data[y * self.cols + x]
+        return m
+
+    def fill(self, value):
+        return Mat(self.rows, self.cols, [value] * len(self.data))
+
+    def map(self, func):
+        return Mat(self.rows, self.cols, [normalize(func(x)) for x in self.data])
+
+    def transpose(self):
+        return Mat(self.cols, self.rows, [self.data[y * self.cols + x] for x in xrange(self.cols) for y in xrange(self.rows)])
+
+    def augment(self, other):
+        if self.rows != other.rows:
+            raise ExecutionError('dimension mismatch: %i and %i rows' % (self.rows, other.rows))
+
+        data = []
+        for a, b in zip(self.tolist(), other.tolist()):
+            data += a + b
+        return Mat(self.rows, self.cols + other.cols, data)
+
+    def square(self):
+        if self.rows != self.cols:
+            raise ExecutionError('matrix is not square: %ix%i' % (self.rows, self.cols))
+
+    def mul(self, other):
+        if self.cols != other.rows:
+            raise ExecutionError('dimension mismatch: %ix%i * %ix%i' % (self.rows, self.cols, other.rows, other.cols))
+
+        if self.use_numpy() or other.use_numpy():
+            return Mat.from_array(numpy.dot(self.array(), other.array()))
+
+        cols = [other.data[x::other.cols] for x in xrange(other.cols)]
+        data = []
+        for row in self.tolist():
+            for col in cols:
+                data.append(clean(sum(a * b for a, b in zip(row, col))))
+        return Mat(self.rows, other.cols, data)
+
+    def power(self, n):
+        self.square()
+        if not isinstance(n, (int, long)) or n < 0:
+            raise ExecutionError('matrix power needs to be a whole number: %s' % n)
+
+        out = Mat.identity(self.rows)
+        base = self
+        while n:
+            if n & 1:
+                out = out.mul(base)
+            base = base.mul(base)
+            n >>= 1
+        return out
+
+    def eliminate(self):
+        # Gauss-Jordan elimination with partial pivoting
+        # returns the reduced matrix and the product of the pivots, which is the determinant of square matrices
+        if self.use_numpy():
+            return eliminate_numpy(self.array())
+        else:
+            return eliminate_list([[float(x) for x in row] for row in self.tolist()])
+
+    def rref(self):
+        if self.rows > self.cols:
+            raise ExecutionError('rref( needs at least as many columns as rows: %ix%i' % (self.rows, self.cols))
+
+        return self.eliminate()[0]
+
+    def det(self):
+        self.square()
+        det = self.eliminate()[1]
+        # the determinant of an integer matrix is an integer
+        if all(isinstance(x, (int, long)) for x in self.data):
+            return int(round(det))
+        return normalize(det)
+
+    def inverse(self):
+        self.square()
+        m, det = self.augment(Mat.identity(self.rows)).eliminate()
+        if det == 0:
+            raise ExecutionError('singular matrix')
+
+        n = self.rows
+        return Mat(n, n, [x for row in m.tolist() for x in row[n:]])
+
+    def __eq__(self, other):
+        return isinstance(other, Mat) and self.dim == other.dim and self.data == other.data
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __len__(self):
+        return self.rows
+
+    def __repr__(self):
+        return 'Mat(%r)' % self.tolist()
+
+def eliminate_list(m):
+    rows, cols = len(m), len(m[0])
+    det = 1.0
+    r = 0
+    for c in xrange(cols):
+        if r == rows:
+            break
+
+        pivot = max(xrange(r, rows), key=lambda i: abs(m[i][c]))
+        if abs(m[pivot][c]) < EPSILON:
+            det = 0
+            continue
+
+        if pivot != r:
+            m[r], m[pivot] = m[pivot], m[r]
+            det = -det
+
+        p = m[r][c]
+        det *= p
+        row = m[r] = [x / p for x in m[r]]
+        for i in xrange(rows):
+            f = m[i][c]
+            if i != r and f:
+                m[i] = [a - f * b for a, b in zip(m[i], row)]
+        r += 1
+
+    if r < rows:
+        det = 0
+
+    return Mat(rows, cols, [clean(x) for row in m for x in row]), det
+
+def eliminate_numpy(m):
+    rows, cols = m.shape
+    det = 1.0
+    r = 0
+    for c in xrange(cols):
+        if r == rows:
+            break
+
+        pivot = r + int(numpy.argmax(numpy.abs(m[r:, c])))
+        if abs(m[pivot, c]) < EPSILON:
+            det = 0
+            continue
+
+        if pivot != r:
+            m[[r, pivot]] = m[[pivot, r]]
+            det = -det
+
+        p = m[r, c]
+        det *= p
+        m[r] /= p
+        col = m[:, c].copy()
+        col[r] = 0
+        m -= numpy.outer(col, m[r])
+        r += 1
+
+    if r < rows:
+        det = 0
+
+    return Mat.from_array(m), float(det)
+
+def apply(vm, token, left, right):
+    # token is an Operator, with at least one Mat operand
+    # token.ufunc names the operation, see vector.py
+    name = token.ufunc
+    both = isinstance(left, Mat) and isinstance(right, Mat)
+    if both and name in ('add', 'subtract'):
+        if left.dim != right.dim:
+            raise ExecutionError('dimension mismatch: %ix%i and %ix%i' % (left.rows, left.cols, right.rows, right.cols))
+
+        return Mat(left.rows, left.cols, [normalize(token.apply(vm, a, b)) for a, b in zip(left.data, right.data)])
+    elif both and name == 'multiply':
+        return left.mul(right)
+    elif both and name in ('equal', 'not_equal'):
+        return int((left == right) == (name == 'equal'))
+    elif name == 'square' and isinstance(left, Mat):
+        return left.power(2)
+    elif name == 'power' and isinstance(left, Mat) and not isinstance(right, Mat):
+        return left.power(right)
+    elif name == 'reciprocal' and isinstance(left, Mat):
+        return left.inverse()
+    elif name == 'multiply' and isinstance(left, Mat) and not isinstance(right, list):
+        return left.map(lambda x: token.apply(vm, x, right))
+    elif name == 'multiply' and isinstance(right, Mat) and not isinstance(left, list):
+        return right.map(lambda x: token.apply(vm, left, x))
+    elif name == 'true_divide' and isinstance(left, Mat) and not isinstance(right, (Mat, list)):
+        return left.map(lambda x: token.apply(vm, x, right))
+
+    raise ExecutionError('invalid matrix operation: %s' % token.token)
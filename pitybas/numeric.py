@@ -0,0 +1,61 @@
+from common import normalize
+
+# the calculator works with 14 significant digits
+DIGITS = 14
+
+def significant(num, digits=DIGITS):
+    # num rounded to this many significant digits, and to an int if that makes it whole
+    if isinstance(num, float):
+        return normalize(float('%.*g' % (digits, num)))
+    elif isinstance(num, complex):
+        return normalize(complex(significant(num.real, digits), significant(num.imag, digits)))
+
+    return num
+
+class Numeric(object):
+    '''
+    arithmetic used by multiplication and division, selected with --numeric
+    '''
+    name = None
+
+    def apply(self, op, left, right):
+        return self.result(op(left, right))
+
+    def result(self, ans):
+        # rounding applied to each product and quotient, also used on numpy results by vector.py
+        return ans
+
+    def round(self, num):
+        # rounding applied by disp_round() when Fix isn't set, to numbers and to each element of lists and matrices
+        return num
+
+class Float(Numeric):
+    '''native python arithmetic'''
+    name = 'float'
+
+class TI14(Float):
+    '''native python arithmetic, rounded to 14 significant digits when displayed'''
+    name = 'ti14'
+
+    def round(self, num):
+        return significant(num)
+
+class Decimal(Numeric):
+    '''
+    native python arithmetic, with products and quotients rounded to 15 significant digits
+    and numbers rounded to 14 when displayed, like the calculator's guard digit
+    it isn't exact: 1/3*3 is 0.999999999999999, but 0.1*3 is 0.3 and 1/3*3 is displayed as 1
+    '''
+    name = 'decimal'
+
+    def result(self, ans):
+        # integer products are already exact, and python's true division is correctly rounded
+        if ans.__class__ is float:
+            return float('%.*g' % (DIGITS + 1, ans))
+
+        return ans
+
+    def round(self, num):
+        return significant(num)
+
+MODES = dict((cls.name, cls) for cls in (Float, TI14, Decimal))
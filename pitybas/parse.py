@@ -1,8 +1,25 @@
 # -*- coding: utf-8 -*-
+import re
+import threading
+from collections import OrderedDict
+
 import tokens
-from common import ParseError, is_number
+from common import ParseError
 from expression import Expression, Bracketed, FunctionArgs, Tuple, ParenExpr, ListExpr, MatrixExpr
 from expression import Base as BaseExpression
+from expression import precompile
+
+def pattern(names):
+    # regex alternation takes the first alternative which matches, so longer tokens need to come first
+    names = sorted(names, key=lambda name: (-len(name), name))
+    return re.compile(u'|'.join(re.escape(name) for name in names), re.UNICODE)
+
+def symbols(names):
+    return set(name[0] for name in names if not name.isalpha())
+
+NUMBER = re.compile(r'-?([0-9]*)(?:\.([0-9]*))?')
+STRING = re.compile(r'"([^"\n]*)"?')
+NAME = re.compile(r'[A-Z0-9]*')
 
 class Parser:
     LOOKUP = {}
@@ -10,7 +27,6 @@ class Parser:
     LOOKUP.update(tokens.Variable.tokens)
     LOOKUP.update(tokens.Function.tokens)
 
-    SYMBOLS = []
     TOKENS = tokens.Token.tokens.keys()
     VARIABLES = tokens.Variable.tokens.keys()
     FUNCTIONS = tokens.Function.tokens.keys()
@@ -20,9 +36,8 @@ class Parser:
     TOKENS.sort()
     TOKENS.reverse()
 
-    for t in TOKENS:
-        if not t[0] in SYMBOLS and not t.isalpha():
-            SYMBOLS.append(t[0])
+    PATTERN = pattern(TOKENS)
+    SYMBOLS = symbols(TOKENS)
 
     def __init__(self, source):
         self.source = unicode(source)
@@ -30,6 +45,10 @@ class Parser:
         self.pos = 0
         self.line = 0
         self.lines = []
+        # the source line of each entry in lines, and of each row returned by parse(), counting from 1
+        self.source_line = 1
+        self.numbers = []
+        self.rows = []
 
         self.stack = []
 
@@ -37,15 +56,74 @@ class Parser:
     def parse_line(vm, line):
         if not line: return
 
-        parser = Parser(line)
-        parser.TOKENS = parser.VARIABLES + parser.FUNCTIONS + parser.OPERATORS
+        return vm.get(LINES.get(line))
 
-        parser.SYMBOLS = []
-        for t in parser.TOKENS:
-            if not t[0] in parser.SYMBOLS and not t.isalpha():
-                parser.SYMBOLS.append(t[0])
+    @staticmethod
+    def source_line(row, rows=None):
+        # rows is the source line of each row, as in Parser.rows; without it, rows are counted from 1
+        if rows and row < len(rows):
+            return rows[row]
 
-        return vm.get(parser.parse()[0][0])
+        return row + 1
+
+    @staticmethod
+    def match_blocks(code, strict=True, rows=None, diagnostics=None):
+        # maps the row of each Then, Else and loop to the (row, col, token) it should jump to when skipped
+        # only the first token of each line is considered, like Interpreter.find()
+        # blocks left open at the end are allowed, as the calculator only looks for their End when skipping them
+        source = lambda row: Parser.source_line(row, rows)
+        jumps = {}
+        stack = []
+        for row, line in enumerate(code):
+            if not line:
+                continue
+
+            token = line[0]
+            if isinstance(token, tokens.Then) or isinstance(token, tokens.Block) and not isinstance(token, tokens.If):
+                stack.append(row)
+            elif isinstance(token, tokens.Else):
+                if stack and isinstance(code[stack[-1]][0], tokens.Then):
+                    jumps[stack.pop()] = (row, 0, token)
+                    stack.append(row)
+                elif strict:
+                    raise ParseError('Else has no matching Then', source(row))
+            elif isinstance(token, tokens.End):
+                if stack:
+                    jumps[stack.pop()] = (row, 0, token)
+                elif strict:
+                    raise ParseError('End has no matching block', source(row))
+
+        if diagnostics is not None:
+            for row in stack:
+                diagnostics.append('%s on line %i has no matching End' % (code[row][0].token, source(row)))
+
+        return jumps
+
+    @staticmethod
+    def index(code, strict=True, rows=None):
+        # returns the block jumps, the (row, col) of each label, and warnings about the code
+        diagnostics = []
+        jumps = Parser.match_blocks(code, strict, rows, diagnostics)
+        source = lambda row: Parser.source_line(row, rows)
+
+        # labels use first-match semantics, so later duplicates are only reported
+        labels = {}
+        for row, line in enumerate(code):
+            if line and isinstance(line[0], tokens.Lbl):
+                label = line[0].get_label()
+                if label in labels:
+                    diagnostics.append('duplicate Lbl %s on line %i (first defined on line %i)' % (label, source(row), source(labels[label][0])))
+                else:
+                    labels[label] = (row, 0)
+
+        for row, line in enumerate(code):
+            for token in line:
+                if isinstance(token, tokens.Goto) and token.arg is not None:
+                    label = tokens.Lbl.guess_label(None, token.arg)
+                    if not label in labels:
+                        diagnostics.append('Goto %s on line %i has no matching Lbl' % (label, source(row)))
+
+        return jumps, labels, diagnostics
 
     def clean(self):
         self.source = self.source.replace('\r\n', '\n').replace('\r', '\n')
@@ -61,7 +139,7 @@ class Parser:
         return pos < self.length
 
     def post(self):
-        for line in self.lines:
+        for line, number in zip(self.lines, self.numbers):
             if line:
                 new = []
                 expr = None
@@ -109,6 +187,7 @@ class Parser:
                     for p in reversed(sorted(pops)):
                         new.pop(p)
 
+                self.rows.append(number)
                 yield new
 
     def parse(self):
@@ -128,6 +207,8 @@ class Parser:
 
                 self.inc()
                 self.line += 1
+                if char == '\n':
+                    self.source_line += 1
                 continue
             elif char in ' \t':
                 self.inc()
@@ -200,7 +281,7 @@ class Parser:
                 self.inc()
                 continue
             elif '0' <= char <= '9' or char == '.'\
-                    or isinstance(self.token(sub=True, inc=False), tokens.Minus) and self.number(test=True):
+                    or char == '-' and isinstance(self.token(sub=True, inc=False), tokens.Minus) and self.number(test=True):
                 result = tokens.Value(self.number())
             elif char in u'l∟' and self.more(self.pos+1) and self.source[self.pos+1] in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789':
                 result = self.list()
@@ -246,6 +327,7 @@ class Parser:
         elif not isinstance(token, FunctionArgs):
             while self.line >= len(self.lines):
                 self.lines.append([])
+                self.numbers.append(self.source_line)
 
             self.lines[self.line].append(token)
 
@@ -267,53 +349,27 @@ class Parser:
                 self.token()
 
     def token(self, sub=False, inc=True):
-        remaining = self.source[self.pos:]
-        for token in self.TOKENS:
-            if remaining.startswith(token):
-                if inc:
-                    self.inc(len(token))
-                return self.LOOKUP[token]()
-        else:
-            if not sub:
-                near = remaining[:8].split('\n',1)[0]
-                self.error('no token found at pos %i near "%s"' % (self.pos, repr(near)))
-
-    def number(self, dot=True, test=False, inc=True):
-        num = ''
-        first = True
-        pos = self.pos
-        while self.more(pos):
-            char = self.source[pos]
-            if char == '-' and first: pass
-            elif not char.isdigit():
-                break
-
-            first = False
-            num += char
-            pos += 1
-
-        if char == '.' and dot:
-            num += '.'
-            pos += 1
-
-            self.pos, tmp = pos, self.pos
-            try:
-                num += str(self.number(dot=False))
-            except ParseError:
-                pass
-
-            pos, self.pos = self.pos, tmp
-
-        if inc and not test: self.pos = pos
-
-        if is_number(num):
+        match = self.PATTERN.match(self.source, self.pos)
+        if match:
+            if inc:
+                self.pos = match.end()
+            return self.LOOKUP[match.group()]()
+        elif not sub:
+            near = self.source[self.pos:self.pos+8].split('\n',1)[0]
+            self.error('no token found at pos %i near "%s"' % (self.pos, repr(near)))
+
+    def number(self, test=False, inc=True):
+        match = NUMBER.match(self.source, self.pos)
+        num, pos = match.group(), match.end()
+
+        # needs at least one digit on either side of the decimal point
+        if match.group(1) or match.group(2):
             if test: return True
-            try:
-                n = int(num)
-            except ValueError:
-                n = float(num)
+            if inc: self.pos = pos
 
-            return n
+            if '.' in num:
+                return float(num)
+            return int(num)
         else:
             if test: return False
             lines = self.source[:pos]
@@ -322,34 +378,15 @@ class Parser:
             raise ParseError('invalid number ending at {}:{}: {}'.format(line, col, num))
 
     def string(self):
-        ret = ''
-        self.inc()
+        # the closing quote is optional at the end of a line
+        match = STRING.match(self.source, self.pos)
+        self.pos = match.end()
+        return match.group(1)
 
-        while self.more():
-            char = self.source[self.pos]
-            if char == '"':
-                self.inc()
-                break
-
-            elif char == '\n':
-                break
-
-            ret += char
-            self.inc()
-
-        return ret
-
-    def all(self, match='ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'):
-        ret = ''
-        while self.more():
-            char = self.source[self.pos]
-            if char in match:
-                ret += char
-                self.inc()
-            else:
-                break
-
-        return ret
+    def all(self, match=NAME):
+        name = match.match(self.source, self.pos).group()
+        self.pos += len(name)
+        return name
 
     def list(self):
         self.inc()
@@ -365,3 +402,56 @@ class Parser:
         self.inc()
 
         return tokens.Matrix(name)
+
+class LineParser(Parser):
+    '''
+    parses the expressions given to expr( and numeric Input/Prompt
+    which only understand variables, functions and operators
+    '''
+    PATTERN = pattern(Parser.VARIABLES + Parser.FUNCTIONS + Parser.OPERATORS)
+    SYMBOLS = symbols(Parser.VARIABLES + Parser.FUNCTIONS + Parser.OPERATORS)
+
+class LineCache(object):
+    '''
+    LRU cache of parsed lines, so expr( in a loop only parses each string once
+    the parsed expressions hold no vm state, and are shared by every vm
+    '''
+    def __init__(self, size=256):
+        self.size = size
+        self.lines = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, line):
+        with self.lock:
+            try:
+                token = self.lines.pop(line)
+                self.hits += 1
+            except KeyError:
+                token = None
+                self.misses += 1
+
+            if token is not None:
+                self.lines[line] = token
+                return token
+
+        # parsed outside the lock, as it can raise a ParseError
+        token = LineParser(line).parse()[0][0]
+        precompile(token)
+        with self.lock:
+            if len(self.lines) >= self.size:
+                self.lines.popitem(last=False)
+            self.lines[line] = token
+
+        return token
+
+    def clear(self):
+        with self.lock:
+            self.lines.clear()
+            self.hits = self.misses = 0
+
+    def __repr__(self):
+        return '<LineCache %i/%i lines, %i hits, %i misses>' % (len(self.lines), self.size, self.hits, self.misses)
+
+LINES = LineCache()
@@ -0,0 +1,175 @@
+'''
+counts and times every statement and expression a vm runs, by source line and by token class
+the hooks are only installed by Profiler.install(), so a vm which isn't profiled runs at full speed
+
+a pgrm call only pushes a frame, so the time spent in the called program is counted on its own lines
+the condition of a While, Repeat or For, which End tests again each time around, is counted on the loop's line
+'''
+import linecache
+import os
+from timeit import default_timer as timer
+
+import expression
+import tokens
+
+class Stats(object):
+    __slots__ = ('count', 'total', 'own', 'active')
+
+    def __init__(self):
+        self.count = 0
+        # total includes everything run from inside, own doesn't
+        self.total = 0.0
+        self.own = 0.0
+        # recursive activations are only added to total once
+        self.active = 0
+
+class Profiler(object):
+    def __init__(self):
+        self.lines = {}
+        self.classes = {}
+        # the time spent in nested calls, for each line and token being timed
+        # lines are only nested by statements which run others, like If, so their own time includes expressions
+        self.line_stack = []
+        self.class_stack = []
+        self.vms = []
+        self.get = None
+        self.resume = None
+
+    @staticmethod
+    def enter(table, key, stack):
+        stats = table.get(key)
+        if stats is None:
+            stats = table[key] = Stats()
+
+        stats.count += 1
+        stats.active += 1
+        stack.append(0.0)
+        return stats
+
+    @staticmethod
+    def leave(stats, elapsed, stack):
+        stats.active -= 1
+        if not stats.active:
+            stats.total += elapsed
+
+        stats.own += elapsed - stack.pop()
+        if stack:
+            stack[-1] += elapsed
+
+    def install(self, vm):
+        run = vm.run
+        lines, classes = self.lines, self.classes
+        line_stack, class_stack = self.line_stack, self.class_stack
+        enter, leave = self.enter, self.leave
+
+        def profile_run(cur):
+            # bare expressions are counted by profile_get instead
+            if isinstance(cur, expression.Base):
+                cls = None
+            else:
+                cls = enter(classes, cur.__class__, class_stack)
+
+            line = enter(lines, (vm.program, vm.line), line_stack)
+            start = timer()
+            try:
+                run(cur)
+            finally:
+                elapsed = timer() - start
+                leave(line, elapsed, line_stack)
+                if cls is not None:
+                    leave(cls, elapsed, class_stack)
+
+        # execute() and blocks look up vm.run, so an instance attribute replaces it
+        vm.run = profile_run
+        self.vms.append(vm)
+
+        if self.get is None:
+            get = self.get = expression.Base.__dict__['get']
+
+            def profile_get(expr, vm):
+                stats = enter(classes, expr.__class__, class_stack)
+                start = timer()
+                try:
+                    return get(expr, vm)
+                finally:
+                    leave(stats, timer() - start, class_stack)
+
+            expression.Base.get = profile_get
+
+        if self.resume is None:
+            resume = self.resume = tokens.Loop.__dict__['resume']
+
+            def profile_resume(block, vm, row, col):
+                # the loop's own row is already being timed when it's reached, rather than resumed by End or Continue
+                if vm.current[0] == row:
+                    return resume(block, vm, row, col)
+
+                stats = enter(lines, (vm.program, row), line_stack)
+                start = timer()
+                try:
+                    return resume(block, vm, row, col)
+                finally:
+                    leave(stats, timer() - start, line_stack)
+
+            tokens.Loop.resume = profile_resume
+
+    def uninstall(self):
+        for vm in self.vms:
+            del vm.run
+        self.vms = []
+
+        if self.get is not None:
+            expression.Base.get = self.get
+            self.get = None
+
+        if self.resume is not None:
+            tokens.Loop.resume = self.resume
+            self.resume = None
+
+    def location(self, program, row):
+        # maps a row of parsed code back to its file, line and source text
+        name = '<string>'
+        if program.filename:
+            name = os.path.basename(program.filename)
+
+        code = ''
+        if row < len(program.code):
+            code = repr(program.code[row])
+
+        number = program.source_line(row)
+        if number is None:
+            return '%s row %i' % (name, row), code
+
+        text = ''
+        if program.filename:
+            text = linecache.getline(program.filename, number).decode('utf8', 'replace').strip()
+
+        return '%s:%i' % (name, number), text or code
+
+    def report(self, out, limit=20):
+        total = sum(stats.own for stats in self.lines.values()) or 1.0
+
+        # statements split with : share a source line, so their rows are combined
+        merged = {}
+        for (program, row), stats in self.lines.items():
+            where, text = self.location(program, row)
+            entry = merged.get(where)
+            if entry is None:
+                entry = merged[where] = [0, 0.0, 0.0, text]
+
+            entry[0] += stats.count
+            entry[1] += stats.total
+            entry[2] += stats.own
+
+        print >>out, '-===[ Profile: hot lines ]===-'
+        print >>out, '%10s %10s %10s %6s  %s' % ('count', 'total', 'self', '%', 'line')
+        rows = sorted(merged.items(), key=lambda item: item[1][2], reverse=True)
+        for where, (count, cum, own, text) in rows[:limit]:
+            print >>out, '%10i %9.4fs %9.4fs %5.1f%%  %s  %s' % (count, cum, own, own / total * 100, where, text)
+
+        print >>out
+        print >>out, '-===[ Profile: token classes ]===-'
+        print >>out, '%10s %10s %10s  %s' % ('count', 'total', 'self', 'class')
+        rows = sorted(self.classes.items(), key=lambda item: item[1].own, reverse=True)
+        for cls, stats in rows[:limit]:
+            print >>out, '%10i %9.4fs %9.4fs  %s' % (stats.count, stats.total, stats.own, cls.__name__)
@@ -0,0 +1,45 @@
+from cache import load
+from common import gc_paused
+from expression import precompile
+from parse import Parser
+from tokens import EOF
+
+class Program(object):
+    '''
+    parsed code, with an EOF at the end, and its block jumps and labels
+    a program is never changed once it's built, and everything a running program changes
+    is kept on the vm, so one program can be run by any number of vms and threads at once
+    '''
+    def __init__(self, code, strict=True, rows=None, filename=None):
+        self.code = code + [[EOF()]]
+        # the source line of each row, if known, and the file it was loaded from
+        self.rows = rows
+        self.filename = filename
+        self.jumps, self.labels, self.diagnostics = Parser.index(self.code, strict, rows)
+
+        # expressions would otherwise compile themselves the first time they run
+        with gc_paused():
+            for line in self.code:
+                for token in line:
+                    precompile(token)
+
+    @classmethod
+    def from_string(cls, string, strict=True):
+        parser = Parser(string)
+        code = parser.parse()
+        return cls(code, strict, rows=parser.rows)
+
+    @classmethod
+    def from_file(cls, filename, cache=True, strict=True):
+        code, rows = load(filename, cache)
+        return cls(code, strict, rows=rows, filename=filename)
+
+    def source_line(self, row):
+        if self.rows and row < len(self.rows):
+            return self.rows[row]
+
+    def __len__(self):
+        return len(self.code) - 1
+
+    def __repr__(self):
+        return '<Program %i lines>' % len(self)
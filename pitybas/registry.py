@@ -0,0 +1,77 @@
+import os
+import threading
+
+from common import ExecutionError
+from program import Program
+
+class Registry(object):
+    '''
+    finds and loads the programs run by pgrm
+    the search path is indexed once, and rescanned when a name isn't found
+    parsed programs are kept in memory until their file's mtime changes, and shared by every call
+    '''
+    def __init__(self, path=None, cache=True):
+        self.path = path or ['.']
+        self.cache = cache
+        self.index = None
+        self.programs = {}
+        # a registry can be shared by vms running in several threads
+        self.lock = threading.RLock()
+
+    def scan(self):
+        # names are case insensitive, and earlier directories in the path win
+        index = {}
+        for directory in self.path:
+            try:
+                names = sorted(os.listdir(directory))
+            except OSError:
+                continue
+
+            for name in names:
+                base, ext = os.path.splitext(name)
+                if ext == '.bas' and not base.lower() in index:
+                    index[base.lower()] = os.path.join(directory, name)
+
+        self.index = index
+
+    def find(self, name):
+        if self.index is None:
+            self.scan()
+
+        key = name.lower()
+        if not key in self.index:
+            # the program may have been added since the last scan
+            self.scan()
+
+        return self.index.get(key)
+
+    def mtime(self, filename):
+        if filename is None:
+            return None
+
+        try:
+            return os.stat(filename).st_mtime
+        except OSError:
+            return None
+
+    def load(self, name):
+        with self.lock:
+            return self._load(name)
+
+    def _load(self, name):
+        filename = self.find(name)
+        mtime = self.mtime(filename)
+        if mtime is None and filename is not None:
+            # removed since the last scan
+            self.scan()
+            filename = self.index.get(name.lower())
+            mtime = self.mtime(filename)
+
+        if mtime is None:
+            raise ExecutionError('pgrm{} not found'.format(name))
+
+        entry = self.programs.get(filename)
+        if entry is None or entry[0] != mtime:
+            entry = self.programs[filename] = (mtime, Program.from_file(filename, self.cache))
+
+        return entry[1]
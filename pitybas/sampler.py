@@ -0,0 +1,92 @@
+'''
+samples where a vm is running on a cpu time interval timer, and writes the samples as folded stacks:
+one line per stack, with its frames separated by ; and followed by the number of samples,
+which flamegraph.pl, speedscope and similar tools read
+
+a stack is each pgrm call and open block, from the main program down to the current line
+samples are counted in memory and appended to the file every flush seconds, and tools add up repeated stacks,
+so a run which is killed only loses its last few samples
+'''
+import signal
+import time
+from collections import defaultdict
+
+def frame_name(name, program, row, token=None):
+    # ; separates frames, and the space before the count ends the stack
+    line = program.source_line(row)
+    if line is None:
+        line = 'row %i' % row
+
+    ret = '%s:%s' % (name or '<string>', line)
+    if token is not None:
+        ret += ' ' + token.__class__.__name__
+
+    return ret.replace(';', ',').replace(' ', '_')
+
+def call_row(line, col):
+    # a caller's position is just past its pgrm token, which may have moved it to the start of the next row
+    if col == 0 and line > 0:
+        return line - 1
+
+    return line
+
+class Sampler(object):
+    def __init__(self, vm, out, interval=0.005, flush=1.0):
+        self.vm = vm
+        self.out = out
+        self.interval = interval
+        self.flush_interval = flush
+        self.counts = defaultdict(int)
+        self.samples = 0
+        self.next_flush = 0
+        self.handler = None
+
+    def stack(self):
+        vm = self.vm
+        frames = []
+        for frame in vm.frames:
+            name, program, code, jumps, labels, line, col, blocks, loops, current = frame
+            frames.extend(frame_name(name, program, row, token) for row, col, token in blocks)
+            row = call_row(line, col)
+            frames.append(frame_name(name, program, row, code[row][0]))
+
+        name, program = vm.name, vm.program
+        frames.extend(frame_name(name, program, row, token) for row, col, token in vm.blocks)
+        if vm.current is not None:
+            frames.append(frame_name(name, program, vm.current[0]))
+        return ';'.join(frames)
+
+    def sample(self, signum, frame):
+        # while a frame is pushed or popped, the row may belong to another program than vm.program
+        if self.vm.switching:
+            return
+
+        try:
+            self.counts[self.stack()] += 1
+        except (IndexError, AttributeError):
+            # caught while the code changes, such as when the REPL adds a line
+            return
+
+        self.samples += 1
+        if time.time() >= self.next_flush:
+            self.flush()
+
+    def flush(self):
+        counts, self.counts = self.counts, defaultdict(int)
+        for stack, count in counts.iteritems():
+            self.out.write('%s %i\n' % (stack, count))
+
+        self.out.flush()
+        self.next_flush = time.time() + self.flush_interval
+
+    def start(self):
+        self.next_flush = time.time() + self.flush_interval
+        self.handler = signal.signal(signal.SIGPROF, self.sample)
+        # restart system calls like reading input instead of failing them with EINTR
+        signal.siginterrupt(signal.SIGPROF, False)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, self.handler or signal.SIG_DFL)
+        self.flush()
@@ -1,13 +1,15 @@
 # -*- coding: utf-8 -*-
 import datetime
-import decimal
 import fractions
 import math
+import operator
 import random
 import string
 
 from common import Pri, ExecutionError, StopError, ReturnError
 from expression import Tuple, Expression, Arguments, ListExpr, MatrixExpr
+from matrix import Mat
+import vector
 
 # helpers
 
@@ -273,26 +275,19 @@ class Matrix(Variable, Stub):
 
             a, b = value
             try:
-                m = vm.get_matrix(self.name)
+                m = vm.get_matrix(self.name).resize(a, b)
             except KeyError:
-                m = [[]]
+                m = Mat(a, b)
 
-            m = m[:a]
-            for i in xrange(len(m), a):
-                n = ([0] * b)
-                m.append(n)
-
-            m = [l[:b] + ([0] * (b - len(l))) for l in m]
             vm.set_matrix(self.name, m)
         else:
-            val = vm.get_matrix(self.name)
-            return [len(val), len(val[0])]
+            return vm.get_matrix(self.name).dim
 
     def get(self, vm):
         if self.arg:
             arg = vm.get(self.arg)
             assert isinstance(arg, list) and len(arg) == 2
-            return vm.get_matrix(self.name)[arg[0]-1][arg[1]-1]
+            return vm.get_matrix(self.name).get(*arg)
 
         return vm.get_matrix(self.name)
 
@@ -302,11 +297,13 @@ class Matrix(Variable, Stub):
             assert isinstance(arg, list) and len(arg) == 2
             assert isinstance(value, (int, long, float, complex))
 
-            m = vm.get_matrix(self.name)
-            m[arg[0]-1][arg[1]-1] = value
+            vm.get_matrix(self.name).set(arg[0], arg[1], value)
         else:
-            assert isinstance(value, list)
-            vm.set_matrix(self.name, value)
+            if isinstance(value, list):
+                value = Mat.from_rows(value)
+
+            assert isinstance(value, Mat)
+            vm.set_matrix(self.name, value.copy())
 
         return value
 
@@ -332,17 +329,13 @@ class dim(Function):
         return value
 
 class augment(Function):
-    def get(self, vm):
-        assert self.arg and len(self.arg) == 2
-        a = self.arg.contents[0].flatten()
-        b = self.arg.contents[1].flatten()
-        if isinstance(a, (List, ListExpr)) and isinstance(b, (List, ListExpr)):
-            return vm.get(a) + vm.get(b)
-        elif isinstance(a, (Matrix, MatrixExpr)) and isinstance(b, (Matrix, MatrixExpr)):
-            a = vm.get(a)
-            b = vm.get(b)
-            assert len(a) == len(b)
-            return [left + b[i] for i, left in enumerate(a)]
+    def call(self, vm, args):
+        assert len(args) == 2
+        a, b = args
+        if isinstance(a, list) and isinstance(b, list):
+            return a + b
+        elif isinstance(a, Mat) and isinstance(b, Mat):
+            return a.augment(b)
         else:
             raise ExecutionError('augment() requires List, List or Matrix, Matrix')
 
@@ -360,16 +353,22 @@ class Fill(Function):
             l = [num for i in xrange(len(vm.get(var)))]
             var.set(vm, l)
         elif isinstance(var, Matrix):
-            m = []
-            o = vm.get(var)
-            for a in o:
-                c = []
-                for b in a:
-                    c.append(num)
+            var.set(vm, vm.get(var).fill(num))
+
+class det(Function):
+    def call(self, vm, args):
+        assert len(args) == 1 and isinstance(args[0], Mat)
+        return args[0].det()
 
-                m.append(c)
+class identity(Function):
+    def call(self, vm, args):
+        assert len(args) == 1 and isinstance(args[0], (int, long))
+        return Mat.identity(args[0])
 
-            var.set(vm, m)
+class rref(Function):
+    def call(self, vm, args):
+        assert len(args) == 1 and isinstance(args[0], Mat)
+        return args[0].rref()
 
 class seq(Function):
     def get(self, vm):
@@ -398,7 +397,12 @@ class Sum(Function):
         return sum(vm.get(arg))
 
 class Ans(Const):
-    def get(self, vm): return vm.get_var('Ans')
+    def get(self, vm):
+        value = vm.regs[self.slot]
+        if value is None:
+            raise KeyError('Ans')
+
+        return value
 
 class Pi(Const):
     token = u'π'
@@ -408,27 +412,24 @@ class e(Const):
     token = 'e'
     value = math.e
 
+# simple variables live in Interpreter.regs, at the slot of their class
 class SimpleVar(Variable, Stub):
-    def set(self, vm, value): return vm.set_var(self.token, value)
-    def get(self, vm): return vm.get_var(self.token)
+    slot = None
 
-class NumVar(SimpleVar, Stub):
-    def get(self, vm):
-        return vm.get_var(self.token, 0)
+    def set(self, vm, value):
+        vm.regs[self.slot] = value
+        return value
 
-class StrVar(SimpleVar, Stub):
     def get(self, vm):
-        return vm.get_var(self.token, '')
+        return vm.regs[self.slot]
+
+class NumVar(SimpleVar, Stub): pass
+class StrVar(SimpleVar, Stub): pass
 
 class Theta(NumVar):
     token = u'\u03b8'
 
-class THETA(NumVar):
-    def set(self, vm, value):
-        return vm.set_var(Theta.token, value)
-
-    def get(self, vm):
-        return vm.get_var(Theta.token)
+class THETA(NumVar): pass
 
 for c in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ':
     add_class(c, NumVar)
@@ -439,6 +440,17 @@ class Str(SimpleVar, Stub):
 for i in xrange(10):
     add_class('Str%i' % i, StrVar)
 
+REGISTERS = list('ABCDEFGHIJKLMNOPQRSTUVWXYZ') + [Theta.token] + ['Str%i' % i for i in xrange(10)] + ['Ans']
+SLOTS = dict((name, slot) for slot, name in enumerate(REGISTERS))
+
+# unset numbers read as 0 and strings as '', while an unset Ans is an error
+DEFAULTS = [0] * 27 + [''] * 10 + [None]
+
+for name, slot in SLOTS.items():
+    Variable.tokens[name].slot = slot
+
+THETA.slot = Theta.slot
+
 # operators
 
 class Stor(Token):
@@ -453,25 +465,31 @@ class Stor(Token):
 class Store(Stor): token = '->'
 
 class Operator(Token, Stub):
+    # name of the numpy ufunc used on long lists, see vector.py
+    ufunc = None
+    # whether results go through the vm's numeric mode
+    numeric = False
+
     @get
     def run(self, vm, left, right):
+        return self.apply(vm, left, right)
+
+    # apply() takes plain values, and is called directly by compiled expressions
+    def apply(self, vm, left, right):
+        if left.__class__ in vector.TYPES or right.__class__ in vector.TYPES:
+            return vector.apply(vm, self, left, right)
+
         return self.op(left, right)
 
+# arithmetic is done by the vm's numeric mode, see numeric.py
 class FloatOperator(Operator, Stub):
-    @get
-    def run(self, vm, left, right):
-        # TODO: be smarter about when to coerce to float
-        if isinstance(left, (int, long)) or isinstance(right, (int, long)):
-            decimal.getcontext().prec = max(len(str(left)), len(str(right)))
-            left = decimal.Decimal(left)
-            right = decimal.Decimal(right)
+    numeric = True
 
-        ans = self.op(left, right)
-        # 14 digits of precision?
-        if abs(ans - int(ans)) < 0.00000000000001:
-            ans = int(ans)
+    def apply(self, vm, left, right):
+        if left.__class__ in vector.TYPES or right.__class__ in vector.TYPES:
+            return vector.apply(vm, self, left, right)
 
-        return ans
+        return vm.numeric.apply(self.op, left, right)
 
 class AddSub(Operator, Stub): priority = Pri.ADDSUB
 class MultDiv(FloatOperator, Stub): priority = Pri.MULTDIV
@@ -483,16 +501,27 @@ class RightExponent(Exponent, Stub):
 class Bool(Operator, Stub):
     priority = Pri.BOOL
 
-    @get
-    def run(self, vm, left, right):
+    def apply(self, vm, left, right):
+        if left.__class__ in vector.TYPES or right.__class__ in vector.TYPES:
+            return vector.apply(vm, self, left, right)
+
         return int(bool(self.bool(left, right)))
 
 # a Function expecting a single Expression as the argument
 class MathExprFunction(Function, Stub):
+    ufunc = None
+
     def get(self, vm):
         assert len(self.arg) == 1
         args = vm.get(self.arg)
-        return self.call(vm, args[0])
+        return self.evaluate(vm, args[0])
+
+    # lists are handled element-wise
+    def evaluate(self, vm, arg):
+        if arg.__class__ in vector.TYPES:
+            return vector.call(vm, self, arg)
+
+        return self.call(vm, arg)
 
 class Logic(Bool): priority = Pri.LOGIC
 
@@ -501,49 +530,66 @@ class Logic(Bool): priority = Pri.LOGIC
 class Plus(AddSub):
     token = '+'
 
+    ufunc = 'add'
+
     def op(self, left, right):
         return left + right
 
 class Minus(AddSub):
     token = '-'
 
+    ufunc = 'subtract'
+
     def op(self, left, right):
         return left - right
 
 class Mult(MultDiv):
     token = '*'
 
+    ufunc = 'multiply'
+
     def op(self, left, right):
         return left * right
 
 class Div(MultDiv):
     token = '/'
 
+    ufunc = 'true_divide'
+
     def op(self, left, right):
-        return left / right
+        # integers shouldn't be floor divided
+        return operator.truediv(left, right)
 
 class Pow(Exponent):
     token = '^'
 
+    ufunc = 'power'
+
     def op(self, left, right):
         return left ** right
 
 class transpose(RightExponent):
     token = '_T'
 
+    def apply(self, vm, left, right):
+        if not isinstance(left, Mat):
+            raise ExecutionError('transpose requires a Matrix')
+
+        return left.transpose()
+
+class Inverse(RightExponent):
+    token = u'⁻¹'
+    ufunc = 'reciprocal'
+
     def op(self, left, right):
-        vm = {'tmp': left}
-        rows, cols = Matrix('tmp').dim(vm)
-        out = [[0] * rows for i in xrange(cols)]
-        for y in xrange(rows):
-            for x in xrange(cols):
-                out[x][y] = left[y][x]
-        return out
+        return 1.0 / left
 
 # TODO: -¹, ², ³, √(, ³√(, ×√
 class Square(RightExponent):
     token = u'²'
 
+    ufunc = 'square'
+
     def op(self, left, right):
         return left ** 2
 
@@ -556,6 +602,8 @@ class Cube(RightExponent):
 class Sqrt(MathExprFunction):
     token = u'√'
 
+    ufunc = 'sqrt'
+
     def call(self, vm, arg):
         return math.sqrt(arg)
 
@@ -590,6 +638,8 @@ class SciNot(Operator):
 class Abs(MathExprFunction):
     token = 'abs'
 
+    ufunc = 'absolute'
+
     def call(self, vm, arg):
         return abs(arg)
 
@@ -665,15 +715,22 @@ class Round(Function):
         else:
             places = 9
 
+        if isinstance(args[0], list):
+            return [round(arg, places) for arg in args[0]]
+
         return round(args[0], places)
 
 class Int(MathExprFunction):
     token = 'int'
 
+    ufunc = 'floor'
+
     def call(self, vm, arg):
         return math.floor(arg)
 
 class iPart(MathExprFunction):
+    ufunc = 'trunc'
+
     def call(self, vm, arg):
         return int(arg)
 
@@ -682,10 +739,14 @@ class fPart(MathExprFunction):
         return math.modf(arg)[1]
 
 class floor(MathExprFunction):
+    ufunc = 'floor'
+
     def call(self, vm, arg):
         return math.floor(arg)
 
 class ceiling(MathExprFunction):
+    ufunc = 'ceil'
+
     def call(self, vm, arg):
         return math.ceil(arg)
 
@@ -702,52 +763,76 @@ class expr(MathExprFunction):
 # trig
 
 class sin(MathExprFunction):
+    ufunc = 'sin'
+
     def call(self, vm, arg): return math.sin(arg)
 
 class cos(MathExprFunction):
+    ufunc = 'cos'
+
     def call(self, vm, arg): return math.cos(arg)
 
 class tan(MathExprFunction):
+    ufunc = 'tan'
+
     def call(self, vm, arg): return math.tan(arg)
 
 # TODO: subclass these inverse functions with the unicode -1 token, and probably add support for that in the parser for ints too
 class asin(MathExprFunction):
     token = 'sin-1'
 
+    ufunc = 'arcsin'
+
     def call(self, vm, arg): return math.asin(arg)
 
 class acos(MathExprFunction):
     token = 'cos-1'
 
+    ufunc = 'arccos'
+
     def call(self, vm, arg): return math.acos(arg)
 
 class atan(MathExprFunction):
     token = 'tan-1'
 
+    ufunc = 'arctan'
+
     def call(self, vm, arg): return math.atan(arg)
 
 class sinh(MathExprFunction):
+    ufunc = 'sinh'
+
     def call(self, vm, arg): return math.sinh(arg)
 
 class cosh(MathExprFunction):
+    ufunc = 'cosh'
+
     def call(self, vm, arg): return math.cosh(arg)
 
 class tanh(MathExprFunction):
+    ufunc = 'tanh'
+
     def call(self, vm, arg): return math.tanh(arg)
 
 class asinh(MathExprFunction):
     token = 'sin-1'
 
+    ufunc = 'arcsinh'
+
     def call(self, vm, arg): return math.asinh(arg)
 
 class acosh(MathExprFunction):
     token = 'cos-1'
 
+    ufunc = 'arccosh'
+
     def call(self, vm, arg): return math.acosh(arg)
 
 class atanh(MathExprFunction):
     token = 'tan-1'
 
+    ufunc = 'arctanh'
+
     def call(self, vm, arg): return math.atanh(arg)
 
 # probability
@@ -776,7 +861,9 @@ class Factorial(Exponent):
 
 # random numbers
 
-class rand(Variable):
+class Rand(Variable):
+    token = 'rand'
+
     def get(self, vm):
         return random.random()
 
@@ -817,23 +904,30 @@ class randBin(Function):
 
 class randM(Function):
     def call(self, vm, args):
-        raise NotImplementedError # I don't know how I'm going to do lists and matricies yet
+        assert len(args) == 2
+        return Mat.random(*args)
 
 # boolean
 
 class And(Bool):
     token = 'and'
 
+    ufunc = 'logical_and'
+
     def bool(self, left, right):
         return left and right
 
 class Or(Bool):
     token = 'or'
 
+    ufunc = 'logical_or'
+
     def bool(self, left, right):
         return left or right
 
 class xor(Bool):
+    ufunc = 'logical_xor'
+
     def bool(self, left, right):
         return left ^ right
 
@@ -844,6 +938,9 @@ class Not(Function):
         args = vm.get(self.arg)
         assert len(args) == 1
 
+        if isinstance(args[0], list):
+            return [int(not arg) for arg in args[0]]
+
         return int(bool(not args[0]))
 
 # logic
@@ -851,12 +948,16 @@ class Not(Function):
 class Equals(Logic):
     token = '='
 
+    ufunc = 'equal'
+
     def bool(self, left, right):
         return left == right
 
 class NotEquals(Logic):
     token = '~='
 
+    ufunc = 'not_equal'
+
     def bool(self, left, right):
         return left != right
 
@@ -866,18 +967,24 @@ class NotEqualsToken(NotEquals):
 class LessThan(Logic):
     token = '<'
 
+    ufunc = 'less'
+
     def bool(self, left, right):
         return left < right
 
 class GreaterThan(Logic):
     token = '>'
 
+    ufunc = 'greater'
+
     def bool(self, left, right):
         return left > right
 
 class LessOrEquals(Logic):
     token = '<='
 
+    ufunc = 'less_equal'
+
     def bool(self, left, right):
         return left <= right
 
@@ -887,6 +994,8 @@ class LessOrEqualsToken(LessOrEquals):
 class GreaterOrEquals(Logic):
     token = '>='
 
+    ufunc = 'greater_equal'
+
     def bool(self, left, right):
         return left >= right
 
@@ -924,7 +1033,11 @@ class length(Function):
 class Block(StubToken):
     absorbs = (Expression, Value)
 
-    def find_end(self, vm, or_else=False, cur=False):
+    def find_end(self, vm, row, or_else=False, cur=False):
+        # row is the line of the Then, Else or loop being skipped
+        if row in vm.jumps:
+            return vm.jumps[row]
+
         tokens = vm.find(Block, Then, Else, End, wrap=False)
         blocks = []
         thens = 0
@@ -960,11 +1073,12 @@ class If(Block):
 
         cur = vm.cur()
         if isinstance(cur, Then):
+            row = vm.line
             vm.push_block()
             vm.inc()
 
             if not true:
-                end = self.find_end(vm, or_else=True)
+                end = self.find_end(vm, row, or_else=True)
                 if end:
                     row, col, end = end
                     if isinstance(end, End):
@@ -990,7 +1104,7 @@ class Else(Token):
     def run(self, vm):
         row, col, block = vm.pop_block()
         assert isinstance(block, If)
-        end = block.find_end(vm)
+        end = block.find_end(vm, vm.current[0])
         if end:
             row, col, end = end
         else:
@@ -1004,7 +1118,7 @@ class Loop(Block, Stub):
         if self.arg == None:
             raise ExecutionError('%s statement without condition' % self.token)
 
-        row, col, _ = vm.running[-1]
+        row, col, _ = vm.current
         self.resume(vm, row, col)
 
     def loop(self, vm):
@@ -1020,7 +1134,7 @@ class Loop(Block, Stub):
 
     def stop(self, vm, row, col):
         vm.goto(row, col)
-        end = self.find_end(vm)
+        end = self.find_end(vm, row)
         if end:
             row, col, end = end
         else:
@@ -1038,7 +1152,10 @@ class Repeat(Loop):
         return not bool(vm.get(self.arg))
 
 class For(Loop, Function):
-    pos = None
+    def run(self, vm):
+        # reaching the For row starts the loop over, even if a Goto left it before it ended
+        vm.loops.pop(id(self), None)
+        Loop.run(self, vm)
 
     def loop(self, vm):
         if len(self.arg) in (3, 4):
@@ -1053,13 +1170,16 @@ class For(Loop, Function):
             forward = inc > 0
             start, end = args
 
-            if self.pos is None:
-                self.pos = vm.get(start)
+            # the position is kept by the vm, so programs can share their parsed code
+            pos = vm.loops.get(id(self))
+            if pos is None:
+                pos = vm.get(start)
             else:
-                self.pos += inc
+                pos += inc
 
-            var.set(vm, self.pos)
-            if forward and self.pos > vm.get(end) or not forward and self.pos < vm.get(end):
+            vm.loops[id(self)] = pos
+            var.set(vm, pos)
+            if forward and pos > vm.get(end) or not forward and pos < vm.get(end):
                 return False
             else:
                 return True
@@ -1067,7 +1187,7 @@ class For(Loop, Function):
             raise ExecutionError('incorrect arguments to For loop')
 
     def stop(self, vm, row, col):
-        self.pos = None
+        vm.loops.pop(id(self), None)
         Loop.stop(self, vm, row, col)
 
 class End(Token):
@@ -1080,8 +1200,10 @@ class End(Token):
 
 class Continue(Token):
     def run(self, vm):
-        for row, col, block in reversed(vm.blocks):
+        # the loop is resumed as End would, so it and any If/Then blocks inside it come off the stack first
+        for i, (row, col, block) in enumerate(reversed(vm.blocks)):
             if not isinstance(block, If):
+                vm.blocks = vm.blocks[:-i - 1]
                 block.resume(vm, row, col)
                 break
         else:
@@ -1107,7 +1229,7 @@ class Lbl(StubToken):
             arg = arg.flatten()
 
         if isinstance(arg, Value):
-            label = vm.get(arg)
+            label = arg.value
         elif isinstance(arg, Variable):
             label = arg.token
         elif isinstance(arg, Expression):
@@ -1115,7 +1237,7 @@ class Lbl(StubToken):
 
         return unicode(label)
 
-    def get_label(self, vm):
+    def get_label(self, vm=None):
         return Lbl.guess_label(vm, self.arg)
 
 class Goto(Token):
@@ -1126,16 +1248,18 @@ class Goto(Token):
     @staticmethod
     def goto(vm, token):
         label = Lbl.guess_label(vm, token)
-        if label:
-            for row, col, token in vm.find(Lbl, wrap=True):
-                if token.get_label(vm) == label:
-                    vm.goto(row, col)
-                    return
+        if label in vm.labels:
+            row, col = vm.labels[label]
+            vm.goto(row, col)
+            return
 
         raise ExecutionError('could not find a label to Goto: %s' % token)
 
 class Menu(Function):
     def run(self, vm):
+        Goto.goto(vm, self.choose(vm))
+
+    def choose(self, vm):
         args = self.arg.contents[:]
         l = len(args)
         if l >= 3 and (l - 3) % 2 == 0:
@@ -1143,8 +1267,7 @@ class Menu(Function):
 
             menu = (title, zip(args[::2], args[1::2])),
 
-            label = vm.io.menu(menu)
-            Goto.goto(vm, label)
+            return vm.io.menu(menu)
         else:
             raise ExecutionError('Invalid arguments to Menu(): %s' % args)
 
@@ -1164,7 +1287,11 @@ class Stop(Token):
 
 class Return(Token):
     def run(self, vm):
-        raise ReturnError
+        # returns to the calling program, or stops the main program
+        if vm.frames:
+            vm.pop_frame()
+        else:
+            raise ReturnError
 
 # input/output
 
@@ -1191,8 +1318,9 @@ class Disp(Token):
 
     @staticmethod
     def format_matrix(data):
-        if isinstance(data, int):
+        if not isinstance(data, Mat):
             return data
+        data = data.tolist()
         out = '[' + str(data[0])
         for row in data[1:]:
             out += '\n ' + str(row)
@@ -1205,25 +1333,24 @@ class Disp(Token):
             self.disp(vm)
             return
 
+        # lists and matrices are rounded before they're formatted
         data = None
         if isinstance(cur, ListExpr):
-            data = str(vm.get(cur))
-        elif isinstance(cur, (MatrixExpr, Matrix)):
-            data = self.format_matrix(vm.get(cur))
+            data = str(vm.disp_round(vm.get(cur)))
+        elif isinstance(cur, MatrixExpr):
+            data = self.format_matrix(vm.disp_round(vm.get(cur)))
         elif isinstance(cur, Tuple):
             items = []
             for arg in cur.contents:
-                data = vm.get(arg)
+                data = vm.disp_round(vm.get(arg))
                 if isinstance(arg, ListExpr):
                     items.append(str(data))
-                elif isinstance(arg, (MatrixExpr, Matrix)):
-                    items.append(self.format_matrix(data))
                 else:
-                    items.append(data)
+                    items.append(self.format_matrix(data))
             self.disp(vm, *items)
             return
         else:
-            data = vm.get(cur)
+            data = self.format_matrix(vm.disp_round(vm.get(cur)))
         self.disp(vm, data)
 
     def disp(self, vm, *msgs):
@@ -1322,9 +1449,10 @@ class REPL(Token):
     def run(self, vm):
         from parse import Parser, ParseError
 
+        row, col, _ = vm.current
         if vm.repl_serial != vm.serial:
             vm.repl_serial = vm.serial
-            ans = vm.vars.get('Ans')
+            ans = vm.regs[Ans.slot]
             if ans is not None:
                 d = Disp()
                 d.arg = Ans()
@@ -1349,9 +1477,11 @@ class REPL(Token):
                     print e
 
         for line in reversed(code):
-            vm.code.insert(self.line, line)
+            vm.code.insert(row, line)
+
+        vm.index()
 
-        vm.line, vm.col = self.line, self.col
+        vm.line, vm.col = row, col
 
 # date commands
 
@@ -0,0 +1,403 @@
+import base64
+import cPickle
+import os
+from functools import partial
+from optparse import OptionParser
+
+import tokens
+from closures import Compiler
+from common import CompileError, ExecutionError, ExpressionError, ParseError, StopError, ReturnError
+from expression import Base as BaseExpression
+from interpret import Interpreter
+from parse import Parser
+from program import Program
+
+# tokens which are turned into python control flow instead of being run
+STRUCTURE = (tokens.If, tokens.Then, tokens.Else, tokens.End, tokens.Loop, tokens.Lbl, tokens.Goto, tokens.Menu,
+             tokens.Break, tokens.Continue, tokens.EOF, tokens.REPL)
+
+HEADER = '''# -*- coding: utf-8 -*-
+# generated by pitybas from %(name)s
+from pitybas.common import normalize as n
+from pitybas.tokens import Value
+from pitybas.vector import TYPES as V
+from pitybas.transpile import goto, load, main
+'''
+
+FOOTER = '''
+if __name__ == '__main__':
+    main(SEGMENTS, %(name)r)
+'''
+
+# for programs which can't be compiled: the parsed code is run by the interpreter
+INTERPRETED = '''# %(reason)s, so this module runs it with the interpreter
+CODE = load(%(data)r)
+
+if __name__ == '__main__':
+    main(None, %(name)r, CODE)
+'''
+
+class Transpiler(Compiler):
+    '''
+    turns a parsed program into a python module
+    each Lbl starts a new segment function, which returns the index of the next segment to run
+    '''
+    def __init__(self, code, name=None, rows=None):
+        Compiler.__init__(self)
+        self.name = name or '<string>'
+        self.rows = rows
+
+        # the interpreter is only used to match blocks and resolve labels
+        self.vm = vm = Interpreter(Program(code, rows=rows))
+        self.code = vm.code
+        self.jumps = vm.jumps
+
+        self.starts = sorted(set([0] + [row for row, col in vm.labels.values()]))
+        self.labels = dict((label, self.starts.index(row)) for label, (row, col) in vm.labels.items())
+
+        self.objects = []
+        self.methods = {}
+        # the value of each constant by its name or python literal
+        self.literals = {}
+
+    def const(self, value):
+        if value is None or isinstance(value, (int, long, float, basestring)):
+            name = repr(value)
+        else:
+            name = 'k%i' % len(self.objects)
+            self.objects.append(value)
+
+        self.literals[name] = value
+        return name
+
+    def literal(self, operand):
+        if operand in self.literals:
+            return True, self.literals[operand]
+
+        return False, None
+
+    def store(self, var, value):
+        # python source storing value in var, skipping the token for simple variables
+        if isinstance(var, BaseExpression):
+            var = var.flatten()
+
+        if isinstance(var, tokens.SimpleVar) and var.__class__.set.im_func is tokens.SimpleVar.set.im_func:
+            return 'vm.regs[%i] = %s' % (var.slot, value)
+
+        return '%s.set(vm, %s)' % (self.const(var), value)
+
+    def method(self, token, name):
+        key = (id(token), name)
+        if not key in self.methods:
+            self.methods[key] = ('m%i' % len(self.methods), self.const(token), name)
+
+        return self.methods[key][0]
+
+    def error(self, row, msg):
+        raise CompileError('%s on line %i' % (msg, Parser.source_line(row, self.rows)))
+
+    def single(self, row):
+        line = self.code[row]
+        if len(line) != 1:
+            self.error(row, 'unexpected tokens after %s' % line[0].token)
+
+        return line[0]
+
+    def statement(self, token, row, out, indent, loops):
+        pad = '    ' * indent
+        if isinstance(token, tokens.Goto):
+            label = tokens.Lbl.guess_label(self.vm, token.arg)
+            if label in self.labels:
+                out.append(pad + 'return %i' % self.labels[label])
+            else:
+                out.append(pad + '%s.run(vm)' % self.const(token))
+        elif isinstance(token, tokens.Menu):
+            out.append(pad + 'return goto(vm, LABELS, %s.choose(vm))' % self.const(token))
+        elif isinstance(token, tokens.Break) and loops:
+            out.append(pad + 'break')
+        elif isinstance(token, tokens.Continue) and loops:
+            out.append(pad + 'continue')
+        elif isinstance(token, tokens.EOF):
+            out.append(pad + 'return None')
+        elif isinstance(token, tokens.pgrm):
+            # the called program is interpreted, and finishes before the next statement
+            out.append(pad + 'vm.call(%r)' % token.name)
+        elif isinstance(token, STRUCTURE):
+            self.error(row, 'cannot compile %s here' % token.token)
+        elif token.can_run:
+            out.append(pad + '%s.run(vm)' % self.const(token))
+        elif token.can_get:
+            value = self.value(token, out, indent)
+            out.append(pad + 'vm.regs[%i] = %s' % (tokens.Ans.slot, value))
+        else:
+            self.error(row, 'cannot run token %s' % token.token)
+
+    def value(self, token, out, indent=None):
+        if indent is None:
+            return Compiler.value(self, token, out)
+
+        lines = []
+        value = Compiler.value(self, token, lines)
+        for line in lines:
+            out.append('    ' * indent + line)
+
+        return value
+
+    def body(self, start, stop, out, indent, loops):
+        length = len(out)
+        self.block(start, stop, out, indent, loops)
+        if len(out) == length:
+            out.append('    ' * indent + 'pass')
+
+    def block(self, start, stop, out, indent, loops=0):
+        # emits rows [start, stop)
+        pad = '    ' * indent
+        row = start
+        while row < stop:
+            line = self.code[row]
+            if not line:
+                row += 1
+                continue
+
+            token = line[0]
+            if isinstance(token, tokens.Lbl):
+                if row != start and row in self.starts:
+                    self.error(row, 'cannot compile Lbl inside a block')
+
+                row += 1
+            elif isinstance(token, tokens.If):
+                self.single(row)
+                if token.arg is None:
+                    self.error(row, 'If statement without condition')
+
+                cond = self.value(token.arg, out, indent)
+                after = self.code[row + 1]
+                if isinstance(after[0], tokens.Then):
+                    then = row + 1
+                    mid = self.end(then, stop)
+                    out.append(pad + 'if %s:' % cond)
+                    self.body(then + 1, mid, out, indent + 1, loops)
+                    row = mid + 1
+
+                    if isinstance(self.code[mid][0], tokens.Else):
+                        end = self.end(mid, stop)
+                        out.append(pad + 'else:')
+                        self.body(mid + 1, end, out, indent + 1, loops)
+                        row = end + 1
+                elif self.chained(row + 1):
+                    row = self.chain(row, cond, out, indent, loops)
+                else:
+                    self.guarded(row + 1)
+                    out.append(pad + 'if %s:' % cond)
+                    self.block(row + 1, row + 2, out, indent + 1, loops)
+                    row += 2
+            elif isinstance(token, tokens.Loop):
+                self.single(row)
+                if token.arg is None:
+                    self.error(row, '%s statement without condition' % token.token)
+
+                end = self.end(row, stop)
+                if isinstance(token, tokens.For):
+                    out.append(pad + 'p%i = None' % row)
+                    out.append(pad + 'while True:')
+                    self.loop_for(token, row, out, indent + 1)
+                else:
+                    out.append(pad + 'while True:')
+                    cond = self.value(token.arg, out, indent + 1)
+                    if isinstance(token, tokens.While):
+                        out.append(pad + '    if not %s: break' % cond)
+                    else:
+                        out.append(pad + '    if %s: break' % cond)
+
+                self.block(row + 1, end, out, indent + 1, loops + 1)
+                row = end + 1
+            else:
+                for token in line:
+                    self.statement(token, row, out, indent, loops)
+                row += 1
+
+    def chained(self, row):
+        # whether row is an If without Then
+        return isinstance(self.code[row][0], tokens.If) and not isinstance(self.code[row + 1][0], tokens.Then)
+
+    def guarded(self, row):
+        # a false If without Then skips only the next row, so a block can't be compiled there
+        token = self.code[row][0]
+        if isinstance(token, (tokens.Block, tokens.Then, tokens.Else, tokens.End, tokens.Lbl)):
+            self.error(row, 'cannot compile %s after If without Then' % token.token)
+
+    def chain(self, row, cond, out, indent, loops):
+        # If without Then followed by more of them: each one which runs decides whether the next row runs,
+        # and one which is skipped leaves the row after it to run, so a flag carries that down the chain
+        pad = '    ' * indent
+        flag = 'g%i' % row
+        out.append(pad + '%s = %s' % (flag, cond))
+        row += 1
+        while self.chained(row):
+            self.single(row)
+            token = self.code[row][0]
+            if token.arg is None:
+                self.error(row, 'If statement without condition')
+
+            out.append(pad + 'if %s:' % flag)
+            cond = self.value(token.arg, out, indent + 1)
+            out.append(pad + '    %s = %s' % (flag, cond))
+            out.append(pad + 'else:')
+            out.append(pad + '    %s = 1' % flag)
+            row += 1
+
+        self.guarded(row)
+        out.append(pad + 'if %s:' % flag)
+        self.block(row, row + 1, out, indent + 1, loops)
+        return row + 1
+
+    def loop_for(self, token, row, out, indent):
+        # mirrors For.loop(): the step is evaluated every iteration, before the start value and the end
+        if len(token.arg) not in (3, 4):
+            self.error(row, 'incorrect arguments to For loop')
+
+        pad = '    ' * indent
+        var = token.arg.contents[0]
+        args = token.arg.contents[1:]
+        pos = 'p%i' % row
+
+        if len(args) == 3:
+            inc = self.value(args[2], out, indent)
+        else:
+            inc = '1'
+
+        out.append(pad + 'if %s is None:' % pos)
+        start = self.value(args[0], out, indent + 1)
+        out.append(pad + '    %s = %s' % (pos, start))
+        out.append(pad + 'else:')
+        out.append(pad + '    %s += %s' % (pos, inc))
+        out.append(pad + self.store(var, pos))
+
+        end = self.value(args[1], out, indent)
+        known, step = self.literal(inc)
+        if known and isinstance(step, (int, long, float)):
+            # the direction of a constant step is known now
+            out.append(pad + 'if %s %s %s: break' % (pos, '>' if step > 0 else '<', end))
+        else:
+            out.append(pad + 'if %s > 0 and %s > %s or not %s > 0 and %s < %s: break' % (inc, pos, end, inc, pos, end))
+
+    def end(self, row, stop):
+        if not row in self.jumps:
+            self.error(row, '%s has no matching End' % self.code[row][0].token)
+
+        end = self.jumps[row][0]
+        if end >= stop:
+            self.error(row, '%s spans a Lbl' % self.code[row][0].token)
+
+        return end
+
+    def transpile(self):
+        body = []
+        # the last line is the EOF appended by the interpreter
+        last = len(self.code) - 1
+        for i, start in enumerate(self.starts):
+            stop = self.starts[i + 1] if i + 1 < len(self.starts) else last
+            body.append('def segment_%i(vm):' % i)
+            self.block(start, stop, body, 1)
+            if stop < last:
+                body.append('    return %i' % (i + 1))
+            else:
+                body.append('    return None')
+            body.append('')
+
+        out = [HEADER % {'name': self.name}]
+        if self.objects:
+            data = base64.b64encode(cPickle.dumps(self.objects, 2))
+            names = ', '.join('k%i' % i for i in xrange(len(self.objects)))
+            out.append('%s, = load(%r)' % (names, data))
+
+        for name, const, method in sorted(self.methods.values(), key=lambda m: int(m[0][1:])):
+            out.append('%s = %s.%s' % (name, const, method))
+
+        out.append('LABELS = %r' % self.labels)
+        out.append('')
+        out += body
+        out.append('SEGMENTS = [%s]' % ', '.join('segment_%i' % i for i in xrange(len(self.starts))))
+        out.append(FOOTER % {'name': self.name})
+
+        return u'\n'.join(out).encode('utf8')
+
+def transpile_file(filename):
+    # returns the module source, and why the program had to be interpreted instead, if it did
+    string = open(filename, 'r').read().decode('utf8')
+    parser = Parser(string)
+    code = parser.parse()
+    name = os.path.basename(filename)
+    try:
+        return Transpiler(code, name, parser.rows).transpile(), None
+    except (CompileError, ExpressionError, ParseError), e:
+        # the interpreter only fails on these when it reaches them, if it ever does
+        reason = e.msg
+        if e.line is not None:
+            reason = '%s on line %i' % (e.msg, e.line)
+
+        return interpreted(code, name, reason), reason
+
+def interpreted(code, name, reason):
+    data = base64.b64encode(cPickle.dumps(code, 2))
+    out = [HEADER % {'name': name}, INTERPRETED % {'name': name, 'reason': reason, 'data': data}]
+    return u'\n'.join(out).encode('utf8')
+
+# runtime used by generated modules
+
+def load(data):
+    return cPickle.loads(base64.b64decode(data))
+
+def goto(vm, labels, token):
+    label = tokens.Lbl.guess_label(vm, token)
+    if label in labels:
+        return labels[label]
+
+    raise ExecutionError('could not find a label to Goto: %s' % token)
+
+def execute(vm, segments):
+    # like Interpreter.execute(), the io is closed before the messages are printed
+    try:
+        with vm.io:
+            pc = 0
+            while pc is not None:
+                pc = segments[pc](vm)
+    except StopError, e:
+        if e.message:
+            print
+            print 'Stopped:', e.message
+    except ReturnError, e:
+        if e.message:
+            print
+            print 'Returned:', e.message
+
+def main(segments, name, code=None):
+    parser = OptionParser(usage='Usage: %prog [options]')
+    parser.add_option('-i', '--io', dest="io", help="select an IO system: simple (default), vt100, headless, memory")
+    parser.add_option('--json', dest="json", action="store_true", help="with -i headless or memory, write output as JSON lines")
+    parser.add_option('--snapshot', dest="snapshot", default="end", type="choice", choices=("end", "step"),
+                      help="with -i memory, write the home screen when the program ends (default), or after each step which changes it")
+    parser.add_option('--fps', dest="fps", type="float", help="with -i vt100, draw the screen at most this many times a second")
+    parser.add_option('-n', '--numeric', dest="numeric", default="decimal", type="choice", choices=("decimal", "float", "ti14"),
+                      help="select a numeric mode: decimal (default, floats rounded to 15 digits after each * and /, and to 14 when displayed), float (native floats), ti14 (native floats rounded to 14 digits when displayed)")
+    (options, args) = parser.parse_args()
+
+    io = None
+    if options.io == 'vt100':
+        from pitybas.io.vt100 import IO as vt100
+        io = partial(vt100, fps=options.fps)
+    elif options.io == 'headless':
+        from pitybas.io.headless import IO as headless
+        io = partial(headless, json=options.json)
+    elif options.io == 'memory':
+        from pitybas.io.memory import IO as memory
+        io = partial(memory, json=options.json, snapshot=options.snapshot)
+
+    vm = Interpreter(code or [], io=io, name=name, numeric=options.numeric)
+    try:
+        if segments is None:
+            vm.execute()
+        else:
+            execute(vm, segments)
+    except KeyboardInterrupt:
+        print
@@ -0,0 +1,94 @@
+# element-wise list arithmetic, vectorized with numpy when it's installed
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import matrix
+from common import ExecutionError, normalize
+from matrix import Mat
+
+# values handled here instead of by the scalar operators
+TYPES = (list, Mat)
+
+# shorter lists aren't worth converting to and from numpy arrays
+THRESHOLD = 32
+
+def array(value):
+    if len(value) < THRESHOLD:
+        return None
+
+    try:
+        arr = numpy.array(value, dtype=float)
+    except (TypeError, ValueError):
+        return None
+
+    # nested lists (matrices) are left to the python path
+    if arr.ndim != 1:
+        return None
+
+    return arr
+
+def ufunc(name, *args):
+    # returns None when the arguments can't be handled by numpy
+    values = []
+    for arg in args:
+        if arg.__class__ is list:
+            arg = array(arg)
+            if arg is None:
+                return None
+        elif arg is None:
+            # right hand operators like Square are filled with a None
+            continue
+        elif not isinstance(arg, (int, long, float)):
+            return None
+
+        values.append(arg)
+
+    try:
+        with numpy.errstate(all='raise'):
+            out = getattr(numpy, name)(*values)
+    except FloatingPointError:
+        # let the python path raise the usual error
+        return None
+
+    if out.dtype == bool:
+        out = out.astype(int)
+
+    return [normalize(x) for x in out.tolist()]
+
+def apply(vm, token, left, right):
+    # token is an Operator, with at least one list or Mat operand
+    if left.__class__ is Mat or right.__class__ is Mat:
+        return matrix.apply(vm, token, left, right)
+
+    if left.__class__ is list and right.__class__ is list and len(left) != len(right):
+        raise ExecutionError('dimension mismatch: %i and %i' % (len(left), len(right)))
+
+    if numpy is not None and token.ufunc is not None:
+        out = ufunc(token.ufunc, left, right)
+        if out is not None:
+            if token.numeric:
+                # rounded like the python path, so results don't depend on the length of the list
+                result = vm.numeric.result
+                return [normalize(result(x)) for x in out]
+            return out
+
+    if left.__class__ is list and right.__class__ is list:
+        return [normalize(token.apply(vm, a, b)) for a, b in zip(left, right)]
+    elif left.__class__ is list:
+        return [normalize(token.apply(vm, a, right)) for a in left]
+    else:
+        return [normalize(token.apply(vm, left, b)) for b in right]
+
+def call(vm, token, values):
+    # token is a MathExprFunction called with a list or Mat
+    if values.__class__ is Mat:
+        return values.map(lambda value: token.evaluate(vm, value))
+
+    if numpy is not None and token.ufunc is not None:
+        out = ufunc(token.ufunc, values)
+        if out is not None:
+            return out
+
+    return [normalize(token.evaluate(vm, value)) for value in values]
@@ -25,3 +25,27 @@ Repeat A>5
 Disp A
 A+1->A
 End
+
+0->N
+Lbl FA
+N+1->N
+For(I,1,5)
+If I=3
+Goto FB
+End
+Lbl FB
+Disp I
+If N<2
+Goto FA
+
+0->C
+For(I,1,3)
+For(J,1,2)
+C+1->C
+If J=2
+Then
+Continue
+End
+End
+End
+Disp C
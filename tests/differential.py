@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# runs every program in tests/ under each expression evaluator, and compiled by transpile.py, and compares the output
+# a program with a .script next to it runs headless, with its input from the script
+import os
+import random
+import sys
+from functools import partial
+from StringIO import StringIO
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(here))
+
+from pitybas.interpret import Interpreter
+from pitybas.io.headless import IO as headless
+from pitybas.io.script import Script
+from pitybas.transpile import execute, transpile_file
+
+# compiled runs the module from pb.py -c, or the interpreter if it fell back to it
+EVALUATORS = ('tree', 'closure', 'compiled')
+
+# answers for programs which Prompt/Input/Menu, the rest of them run into EOF
+INPUT = '3\n4\n'
+
+def run(filename, evaluator):
+    stdin, stdout = sys.stdin, sys.stdout
+    sys.stdin, sys.stdout = StringIO(INPUT), StringIO()
+    random.seed(0)
+    try:
+        io = None
+        script = os.path.splitext(filename)[0] + '.script'
+        if os.path.exists(script):
+            io = partial(headless, script=Script.load(script))
+
+        if evaluator == 'compiled':
+            module = {}
+            exec transpile_file(filename)[0] in module
+            vm = Interpreter(module.get('CODE', []), io=io, name=os.path.basename(filename))
+            if 'SEGMENTS' in module:
+                execute(vm, module['SEGMENTS'])
+            else:
+                vm.execute()
+        else:
+            vm = Interpreter.from_file(filename, evaluator=evaluator, io=io, cache=False)
+            vm.execute()
+    except Exception, e:
+        print
+        print '%s: %s' % (e.__class__.__name__, e)
+    finally:
+        out = sys.stdout.getvalue()
+        sys.stdin, sys.stdout = stdin, stdout
+
+    return out
+
+def main():
+    failed = False
+    for name in sorted(os.listdir(here)):
+        if not name.endswith('.bas'):
+            continue
+
+        filename = os.path.join(here, name)
+        outputs = [run(filename, evaluator) for evaluator in EVALUATORS]
+        if all(out == outputs[0] for out in outputs):
+            print 'ok       %s' % name
+        else:
+            failed = True
+            print 'MISMATCH %s' % name
+            for evaluator, out in zip(EVALUATORS, outputs):
+                print '-===[ %s ]===-' % evaluator
+                print out
+
+    return failed
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -26,3 +26,21 @@ Disp dim(l1), l1
 
 {1,1}->dim([A])
 Disp dim([A]), [A]
+
+Disp "list arithmetic"
+Disp {1,2,3}*2
+Disp {1,2,3}+{4,5,6}
+Disp 10-{1,2,3}
+Disp {1,2,3}>1
+Disp sqrt({1,4,9})
+Disp {1,2,3}²
+
+Disp "long list arithmetic"
+seq(0.1,I,1,5)*3->lA
+seq(0.1,I,1,40)*3->lB
+Disp lA(1)=0.3,lB(1)=0.3,lB(40)=0.3
+seq(I,I,1,40)*0.1->lC
+Disp lC(3)=0.3,lC(40)=4
+
+1/3*3->X
+Disp X,{X,2/3*3}
@@ -0,0 +1,39 @@
+Disp "multiply"
+[[1,2][3,4]]->[A]
+[[5,6][7,8]]->[B]
+Disp [A]*[B]
+Disp [A]*2, [A]+[B], [A]-[B]
+Disp [A]^3
+
+Disp "transpose"
+Disp [[1,2,3][4,5,6]]_T
+
+Disp "det"
+Disp det([A])
+Disp det([[2,0,1][1,3,2][1,1,1]])
+
+Disp "inverse"
+Disp [A]⁻¹
+Disp [A]*[A]⁻¹
+
+Disp "rref"
+Disp rref([[1,2,3][4,5,6]])
+
+Disp "identity"
+Disp identity(3)
+
+Disp "copy"
+[A]->[C]
+9->[C](1,1)
+Disp [A](1,1), [C](1,1)
+
+Disp "fill"
+Fill(7,[C])
+Disp [C]
+
+Disp "augment"
+Disp augment([A],[B])
+
+Disp "dim"
+{3,3}->dim([A])
+Disp dim([A]), [A]